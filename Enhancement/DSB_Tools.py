@@ -3,34 +3,131 @@
 
 # In[ ]:
 
+import collections
 import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Representations'))
+from precision import float_dtypes
+
 rng = np.random.default_rng()
 
+
 class SensorArray:
     """
-    Class to store Uniform Linear Array geometry.
+    Class to store sensor array geometry. 'SensorArray(L, M)' creates a
+    Uniform Linear Array; 'SensorArray.from_positions' and
+    'SensorArray.circular' create arrays of arbitrary 2D or 3D geometry.
     
     L : float
-        Array length [m]
+        Array length (aperture) [m]
     
     M : int
-        Number of sensors (must be odd)
+        Number of sensors (must be odd for a Uniform Linear Array)
     
     d : float
-        Inter sensor spacing [m]
+        Inter sensor spacing [m], None for arbitrary geometries
         
-    XY : (2,M) array_like
-        Numpy array with sensor coordinates in 2D (x,y) space
+    XY : (2,M) or (3,M) array_like
+        Numpy array with sensor coordinates in 2D (x,y) or 3D (x,y,z) space
         
     m : (M,) array_like
-        Numpy array of integer sensor indices, from -(M-1)/2 to +(M-1)/2
+        Numpy array of integer sensor indices, from -(M-1)/2 to +(M-1)/2, None
+        for arbitrary geometries
+    
+    cache_bytes : int
+        Maximum total size of the cached steering phase tensors, in bytes.
+        The least recently used tensors are evicted first. A scan by
+        'delayandsum_beamformer' larger than this caches only its leading
+        angle blocks; raise it to cache whole scans, e.g. about 1 GB for
+        181 angles of 2 s at 48 kHz with 15 sensors in complex64.
     """
     
-    def __init__(self, L, M):
+    def __init__(self, L, M, cache_bytes=2**28):
         self.M = M
         self.L = L
         
         self.XY, self.d, self.m = self.create_unif_lin_array(L, M)
+        
+        self.cache_bytes = cache_bytes
+        self.cached_bytes = 0
+        self.steering_cache = collections.OrderedDict()
+    
+    @classmethod
+    def from_positions(cls, XY, cache_bytes=2**28):
+        """
+        Creates an array with sensors at arbitrary (e.g. measured) positions.
+        
+        Parameters
+        ----------
+        XY : (2, M) or (3, M) array_like
+            Sensor coordinates in 2D (x,y) or 3D (x,y,z) space [m], relative
+            to the array reference point.
+        
+        cache_bytes : int, optional
+            Maximum total size of the cached steering phase tensors, in bytes.
+        
+        Returns
+        -------
+        SensorArrayObj : instance of SensorArray class
+        """
+        
+        XY = np.array(XY, dtype=float)
+        assert XY.ndim == 2 and XY.shape[0] in (2, 3), "Positions must be (2, M) or (3, M)"
+        
+        obj = cls.__new__(cls)
+        obj.M = XY.shape[1]
+        obj.XY, obj.d, obj.m = XY, None, None
+        
+        # aperture: largest distance between two sensors
+        obj.L = np.max(np.linalg.norm(XY[:, :, None] - XY[:, None, :], axis=0))
+        
+        obj.cache_bytes = cache_bytes
+        obj.cached_bytes = 0
+        obj.steering_cache = collections.OrderedDict()
+        return obj
+    
+    @classmethod
+    def circular(cls, radius, M, cache_bytes=2**28):
+        """
+        Creates a Uniform Circular Array of 'M' sensors with radius 'radius' [m]
+        in the (x,y) plane, centered at the origin, with sensor 0 on the 'x'
+        axis.
+        """
+        
+        angles = 2*np.pi*np.arange(M)/M
+        return cls.from_positions(radius*np.stack((np.cos(angles), np.sin(angles))),
+                                  cache_bytes)
+    
+    def time_delays(self, theta, c0=1500):
+        """
+        Time delays (TDoA) of a plane wave arriving from directions 'theta'
+        (radians, in the (x,y) plane, relative to the 'x' axis) at each sensor,
+        relative to the array reference point.
+        
+        Returns
+        -------
+        time_delays : (..., M) array_like
+            Numpy array of time delays, in seconds, for each direction in
+            'theta' and each sensor.
+        """
+        
+        theta = np.asarray(theta)
+        if self.m is not None:
+            # uniform linear array along the 'x' axis
+            return -self.m*self.d*np.cos(theta)[..., None]/c0
+        
+        direction = np.stack((np.cos(theta), np.sin(theta), np.zeros_like(theta)), axis=-1)
+        return -np.matmul(direction[..., :self.XY.shape[0]], self.XY)/c0
+    
+    def max_delay(self, c0=1500):
+        """
+        Largest absolute time delay, in seconds, of any sensor for any
+        direction of arrival.
+        """
+        
+        return np.max(np.linalg.norm(self.XY, axis=0))/c0
 
         
     def create_unif_lin_array(self, L, M):
@@ -82,37 +179,188 @@ class SensorArray:
         return XY_array, d, m_indices
         
 
-def delay_signal(x, t0, fs):
+    def steering_vectors(self, theta, fs, N_dft, c0=1500, dtype=np.complex128,
+                         cache=True):
+        """
+        Returns the steering phase tensor of 'steering_phases' for this array,
+        reusing a cached copy when the same angle grid, sampling frequency,
+        signal length, speed of sound and dtype were requested before.
+        
+        Parameters
+        ----------
+        theta : (N_theta,) array_like
+            Numpy vector containing set of steering directions, in radians.
+        
+        fs : int
+            Sampling frequency, in Hz.
+        
+        N_dft : int
+            Length of the time-domain signals, in samples.
+        
+        c0 : float, optional
+            Speed of sound, in meters per second. The default is 1500 (m/s).
+        
+        dtype : numpy dtype, optional
+            Complex dtype of the returned tensor. Use np.complex64 to halve
+            its size. The default is np.complex128.
+        
+        cache : bool, optional
+            Whether to store a newly computed tensor in the cache. Single-use
+            tensors, such as those of a simulated direction of arrival, pass
+            False so that they do not evict reusable scan grids. The default
+            is True.
+        
+        Returns
+        -------
+        phases : (N_theta, M, N_dft//2+1) array_like
+            Read-only Numpy array of steering phases.
+        """
+        
+        theta = np.atleast_1d(np.asarray(theta, dtype=float))
+        key = (theta.tobytes(), fs, N_dft, c0, np.dtype(dtype).str)
+        
+        if key in self.steering_cache:
+            self.steering_cache.move_to_end(key)
+            return self.steering_cache[key]
+        
+        phases = steering_phases(self, theta, fs, N_dft, c0, dtype)
+        phases.flags.writeable = False
+        
+        # evict least recently used tensors until the new one fits
+        if cache and phases.nbytes <= self.cache_bytes:
+            self.steering_cache[key] = phases
+            self.cached_bytes += phases.nbytes
+            while self.cached_bytes > self.cache_bytes:
+                _, evicted = self.steering_cache.popitem(last=False)
+                self.cached_bytes -= evicted.nbytes
+        
+        return phases
+        
+
+def delay_signal(x, t0, fs, method='fft', taps=33, dtype=None):
     """
     Delay a time-domain signal 'x', sampled at 'fs' Hz, by 't0' seconds.
 
     Parameters
     ----------
-    x : (N_dft,) array_like
-        Numpy vector of length 'N_dft' containing signal of interest
+    x : (..., N_dft) array_like
+        Numpy array whose last axis, of length 'N_dft', contains the signal(s)
+        of interest
 
-    t0 : float
-        Time by which to delay signal 'x', in seconds
+    t0 : float or (...,) array_like
+        Time by which to delay signal 'x', in seconds. An array delays each
+        signal along the leading axes of 'x' by its own time, so all channels
+        are delayed with one batched FFT.
         
     fs : int
         Sampling frequency, in Hz
+    
+    method : {'auto', 'fft', 'fir'}, optional
+        'fft' applies a phase shift to the full-length spectrum, which is
+        exact for band-limited signals but wraps the signal around its ends.
+        'fir' uses 'fractional_delay', which zero-fills the ends and costs
+        O(N_dft*taps), but is only accurate up to about 0.8 times the Nyquist
+        frequency with the default 33 taps. 'auto' accepts that limit and
+        picks 'fir' only when 'N_dft' is not an FFT-friendly length (see
+        'scipy.fft.next_fast_len'), where the full-length FFT is several
+        times slower; otherwise it uses 'fft'. The default is 'fft'.
+    
+    taps : int, optional
+        Length of the fractional-delay filter of the 'fir' method.
+    
+    dtype : numpy dtype, optional
+        Precision of the computation: np.float32 (or np.complex64) runs the
+        FFTs and filters in single precision. The default follows 'x', so
+        float32 signals stay float32.
 
     Returns
     -------
-    x_delayed : (N,)
+    x_delayed : (..., N_dft)
         Time-delayed copy of input signal 'x'
 
     """
     
-    X_f = np.fft.rfft(x)
+    real, complex_ = float_dtypes(x, dtype)
+    x = np.asarray(x, dtype=real)
     
-    N_dft = x.shape[0]
-    df = fs/N_dft
-    f = np.linspace(0, fs-df, N_dft)[:N_dft//2+1]
+    if method == 'auto':
+        import scipy.fft
+        N_dft = x.shape[-1]
+        method = 'fft' if scipy.fft.next_fast_len(N_dft, real=True) == N_dft else 'fir'
+    if method == 'fir':
+        return fractional_delay(x, t0, fs, taps)
+    
+    X_f = np.fft.rfft(x, axis=-1)
+    
+    N_dft = x.shape[-1]
+    f = frequency_vector(N_dft, fs)
+    
+    X_f_delayed = X_f*np.exp(-1j*2*np.pi*f*np.asarray(t0)[..., None]).astype(complex_)
+    
+    return np.fft.irfft(X_f_delayed, n=N_dft, axis=-1)
+
+
+def fractional_delay(x, t0, fs, taps=33):
+    """
+    Delay a time-domain signal 'x' by 't0' seconds with a Kaiser-windowed
+    sinc fractional-delay FIR filter.
+
+    Parameters
+    ----------
+    x : (..., N) array_like
+        Numpy array whose last axis contains the signal(s) of interest
+    
+    t0 : float or (...,) array_like
+        Time by which to delay each signal, in seconds. Negative values
+        advance the signal.
+    
+    fs : int
+        Sampling frequency, in Hz
+    
+    taps : int, optional
+        Odd filter length. The default, 33, keeps the error small up to about
+        0.8 times the Nyquist frequency.
+
+    Returns
+    -------
+    x_delayed : (..., N)
+        Time-delayed copy of 'x'; samples shifted in from outside the signal
+        are zero.
+    
+    Notes
+    -----
+    The delay is split into an integer shift and a fractional part in
+    [-0.5, 0.5] samples. Only the fractional part is filtered, with
+    'scipy.signal.oaconvolve', so the cost is O(N*taps) per channel instead
+    of a full-length FFT. The error grows above about 0.8 times the Nyquist
+    frequency, so the delay is only accurate for signals band-limited below
+    that.
+    """
+    
+    # scipy.signal is slow to import, so only this path loads it
+    import scipy.signal
+    
+    assert taps % 2, "Number of taps must be odd"
+    
+    x = np.asarray(x)
+    N = x.shape[-1]
+    centre = taps//2
+    
+    delay = np.broadcast_to(np.asarray(t0)*fs, x.shape[:-1])
+    integer_delay = np.round(delay).astype(int)
+    fraction = delay - integer_delay
     
-    X_f_delayed = X_f*np.exp(-1j*2*np.pi*f*t0)
+    # one filter per signal, h[k] = sinc(k - centre - fraction)
+    k = np.arange(taps) - centre
+    h = np.sinc(k - fraction[..., None])*np.kaiser(taps, 8.0)
+    y = scipy.signal.oaconvolve(x, h.astype(np.result_type(x.dtype, np.float32)), axes=-1)
     
-    return np.fft.irfft(X_f_delayed)
+    # y[n + centre] is x delayed by the fraction only; shift by the integer part
+    index = np.arange(N) + centre - integer_delay[..., None]
+    valid = (index >= 0) & (index < y.shape[-1])
+    x_delayed = np.take_along_axis(y, np.clip(index, 0, y.shape[-1]-1), axis=-1)
+    
+    return np.where(valid, x_delayed, 0)
 
 
 def create_narrowband_pulse(A, T, f0, fs):
@@ -157,7 +405,7 @@ def create_narrowband_pulse(A, T, f0, fs):
 
 
 def create_array_signals(SensorArrayObj, p_source, t_initial, T, theta0_deg,
-                         fs, c0=1500, SNR_dB=None):
+                         fs, c0=1500, SNR_dB=None, dtype=None):
     """
     Create a Numpy array of time-domain signals simulating a recording with a
     Uniform Linear Array
@@ -189,6 +437,10 @@ def create_array_signals(SensorArrayObj, p_source, t_initial, T, theta0_deg,
     SNR_dB : float, optional
         Signal-to-noise ratio, in decibels, as observed at sensor elements. The
         default is None (no noise at array sensors).
+    
+    dtype : numpy dtype, optional
+        Real dtype of the array signals. np.float32 runs the FFTs in single
+        precision. The default follows 'p_source'.
 
     Returns
     -------
@@ -212,12 +464,12 @@ def create_array_signals(SensorArrayObj, p_source, t_initial, T, theta0_deg,
     # instantiate a random number generator
     rng = np.random.default_rng()
     
+    real, complex_ = float_dtypes(p_source, dtype)
+    p_source = np.asarray(p_source, dtype=real)
+    
     # direction of arrival of signals (plane wave propagation)
     theta0 = theta0_deg*np.pi/180
     
-    # vector of times-of-arrival for each sensor
-    times_of_arrival = -SensorArrayObj.m*SensorArrayObj.d*np.cos(theta0)/c0
-    
     N_initial= int(t_initial*fs)
     N_final = N_initial + p_source.shape[0]
     
@@ -228,28 +480,189 @@ def create_array_signals(SensorArrayObj, p_source, t_initial, T, theta0_deg,
     if SNR_dB is None:
         # if SNR_dB is not given, initialize signals as array of zeros (no
         # noise)
-        p_array = np.zeros((SensorArrayObj.M, N))
+        p_array = np.zeros((SensorArrayObj.M, N), dtype=real)
     
     else:
         # if SNR_dB is given, add random noise to array signals at desired SNR
         signal_var = np.var(p_source)
         noise_var = signal_var/(10**(SNR_dB/10))
-        p_array = rng.normal(0., np.sqrt(noise_var), (SensorArrayObj.M, N))
+        p_array = rng.standard_normal((SensorArrayObj.M, N), dtype=real)
+        p_array *= np.sqrt(noise_var)
     
-    # for each sensor in array...
-    for m in range(SensorArrayObj.M):
-        # ...adds signal at time 't_initial'...
-        p_array[m, N_initial:N_final] += p_source
-        
-        # ...and time-shifts signal for given time-of-arrival
-        p_array[m, :] = delay_signal(p_array[m, :], times_of_arrival[m], fs)
+    # steering phases for the direction of arrival, not cached as they are rarely
+    # reused; delaying each sensor by its time-of-arrival is the conjugate phase shift
+    phases = SensorArrayObj.steering_vectors(theta0, fs, N, c0, complex_, cache=False)[0]
+    
+    # add signal to all sensors at time 't_initial'...
+    p_array[:, N_initial:N_final] += p_source
+    
+    # ...and time-shift all sensors for their times-of-arrival in one batch
+    p_array = np.fft.irfft(np.fft.rfft(p_array, axis=1)*np.conj(phases), n=N, axis=1)
     
     return p_array
 
 
 
+def frequency_vector(N_dft, fs):
+    """
+    Frequency vector, in Hz, of the 'N_dft//2+1' bins returned by 'np.fft.rfft'
+    for a signal of 'N_dft' samples at 'fs' Hz.
+    """
+    
+    df = fs/N_dft
+    return np.linspace(0, fs-df, N_dft)[:N_dft//2+1]
+
+
+def steering_phases(SensorArrayObj, theta, fs, N_dft, c0=1500, dtype=np.complex128):
+    """
+    Calculates the frequency-domain phase shifts that steer a sensor array
+    towards a set of directions.
+    
+    Parameters
+    ----------
+    SensorArrayObj : instance of SensorArray class
+        Instance containing array geometry information
+    
+    theta : (N_theta,) array_like
+        Numpy vector containing set of desired steering directions, in radians.
+    
+    fs : int
+        Sampling frequency, in Hz.
+    
+    N_dft : int
+        Length of the time-domain signals, in samples.
+    
+    c0 : float, optional
+        Speed of sound, in meters per second. The default is 1500 (m/s).
+    
+    dtype : numpy dtype, optional
+        Complex dtype of the returned array. With np.complex64, the phase
+        angles are computed in double precision and their cosines and sines in
+        single precision. The default is np.complex128.
+    
+    Returns
+    -------
+    phases : (N_theta, M, N_dft//2+1) array_like
+        Numpy array of complex exponentials that advance each sensor signal by
+        its time delay for each steering direction.
+    """
+    
+    # candidate time delays (TDoA) for each direction and sensor, (N_theta, M)
+    time_delays = SensorArrayObj.time_delays(np.asarray(theta), c0)
+    
+    f = frequency_vector(N_dft, fs)
+    real, _ = float_dtypes(None, dtype)
+    angles = (2*np.pi*f*time_delays[:, :, None]).astype(real, copy=False)
+    
+    # cos and sin of real angles have vectorized single precision kernels, which
+    # the complex exponential lacks
+    phases = np.empty(angles.shape, dtype=dtype)
+    np.cos(angles, out=phases.real)
+    np.sin(angles, out=phases.imag)
+    
+    return phases
+
+
+def simulate_array_signals(SensorArrayObj, p_sources, t_initial, T, theta0_deg,
+                           fs, c0=1500, SNR_dB=None, dtype=None):
+    """
+    Create time-domain signals simulating recordings of several sources with
+    a sensor array, for one scene or a batch of independent scenes.
+
+    Parameters
+    ----------
+    SensorArrayObj : instance of SensorArray class
+        Instance containing array geometry information
+    
+    p_sources : (S, N_source) or (B, S, N_source) array_like
+        Numpy array containing 'S' clean source signals, optionally for each of
+        'B' scenes. Shorter sources are zero-padded by the caller.
+    
+    t_initial : float or (S,) or (B, S) array_like
+        Time at which each source signal reaches the center array sensor.
+    
+    T : float
+        Total sensor signal duration, in seconds.
+    
+    theta0_deg : float or (S,) or (B, S) array_like
+        Direction of arrival of each source signal, relative to array axis, in
+        degrees.
+    
+    fs : int
+        Sampling frequency, in Hz.
+    
+    c0 : float, optional
+        Speed of sound, in meters per second. The default is 1500 (m/s).
+    
+    SNR_dB : float, optional
+        Signal-to-noise ratio, in decibels, of the sum of the sources to the
+        white noise at each sensor. The default is None (no noise).
+    
+    dtype : numpy dtype, optional
+        Real dtype of the simulation. np.float32 runs the FFTs in single
+        precision. The default follows 'p_sources'.
+
+    Returns
+    -------
+    p_array : (M, T*fs) or (B, M, T*fs) array_like
+        Numpy array containing 'M' channels of array signals over time, for
+        each scene if 'p_sources' has a batch axis.
+
+    Notes
+    -----
+    All sources of all scenes are transformed with one batched rfft, delayed
+    to every sensor by broadcasting their steering phases, summed over sources
+    and transformed back with one batched irfft. The sources are plane waves
+    and the noise is added after the delays; see 'create_array_signals' for
+    the single-source version.
+    """
+    
+    rng = np.random.default_rng()
+    
+    dtype, complex_dtype = float_dtypes(p_sources, dtype)
+    p_sources = np.asarray(p_sources, dtype=dtype)
+    batched = p_sources.ndim == 3
+    if not batched:
+        p_sources = p_sources[None]
+    B, S, N_source = p_sources.shape
+    
+    # No. of samples in array data (total duration)
+    N = int(T*fs)
+    
+    # place every source at its onset; sources running past 'T' are truncated
+    N_initial = np.broadcast_to((np.asarray(t_initial)*fs).astype(int), (B, S))
+    p_placed = np.zeros((B, S, N + N_source), dtype=dtype)
+    np.put_along_axis(p_placed, N_initial[..., None] + np.arange(N_source),
+                      p_sources, axis=-1)
+    P_f = np.fft.rfft(p_placed[..., :N], axis=-1)
+    
+    # times-of-arrival of each source at each sensor, (B, S, M)
+    theta0 = np.broadcast_to(np.asarray(theta0_deg)*np.pi/180, (B, S))
+    times_of_arrival = SensorArrayObj.time_delays(theta0, c0)
+    
+    f = frequency_vector(N, fs).astype(dtype)
+    
+    # delay and sum the sources at each sensor, one source at a time to keep
+    # the (B, M, F) phase tensor the largest temporary
+    P_array = np.zeros((B, SensorArrayObj.M, f.shape[0]), dtype=complex_dtype)
+    for s in range(S):
+        phases = np.exp(-1j*2*np.pi*f*times_of_arrival[:, s, :, None].astype(dtype))
+        P_array += P_f[:, s, None, :]*phases
+    
+    p_array = np.fft.irfft(P_array, n=N, axis=-1)
+    
+    if SNR_dB is not None:
+        # noise variance relative to the total source variance of each scene
+        signal_var = np.sum(np.var(p_sources, axis=-1), axis=-1)
+        noise_var = signal_var/(10**(SNR_dB/10))
+        p_array += (np.sqrt(noise_var)[:, None, None]
+                    *rng.standard_normal(p_array.shape, dtype=dtype))
+    
+    return p_array if batched else p_array[0]
+
+
 def delayandsum_beamformer(SensorArrayObj, p_array, theta, weights, fs,
-                           c0=1500):
+                           c0=1500, max_block_size=2**22, dtype=None):
     """
     Calculates simplified delay-and-sum beamformer for a given array geometry 
     and sensor signals, over a set of pre-determined directions.
@@ -274,36 +687,192 @@ def delayandsum_beamformer(SensorArrayObj, p_array, theta, weights, fs,
     c0 : float, optional
         Speed of sound, in meters per second. The default is 343 (m/s).
     
+    max_block_size : int, optional
+        Maximum number of elements in the (angles, sensors, frequencies) phase
+        tensor built at once. Larger angle grids are steered in blocks. The
+        default is 2**22.
+    
+    dtype : numpy dtype, optional
+        Complex dtype of the steering phases and sensor spectra. np.complex64
+        halves the memory of the cached phase tensors and runs the FFTs in
+        single precision. The default is np.complex64 for float32 'p_array'
+        and np.complex128 otherwise.
+    
     Returns
     -------
     y_beamformer : (N_theta, T*fs,) array_like
         Numpy array containing the time-domain beamformer output signal for
-        each steering direction.
+        each steering direction, in the real counterpart of 'dtype'.
     
+    Notes
+    -----
+    Each sensor signal is transformed once. The steering phases of a block of
+    directions are applied by broadcasting, the weighted sum over sensors is a
+    single einsum in the frequency domain, and each block is brought back to
+    the time domain with one batched inverse FFT, so a scan takes 'M' forward
+    and 'N_theta' inverse FFTs. The phase tensors come from the steering cache
+    of 'SensorArrayObj', so repeated scans over the same grid reuse them. When
+    a scan's phases exceed the 'cache_bytes' of the array, only its leading
+    blocks are cached and the rest are recomputed on every scan; caching all
+    blocks would make each one evict another before it is reused.
     """
     
+    theta = np.asarray(theta)
     N_theta = theta.shape[0]
     
+    real, complex_ = float_dtypes(p_array, dtype)
+    p_array = np.asarray(p_array, dtype=real)
     M, N_time = p_array.shape
     
+    # weighted sensor spectra, (M, N_time//2+1)
+    P_f = np.asarray(weights, dtype=real)[:, None]*np.fft.rfft(p_array, axis=1).astype(complex_, copy=False)
+    N_f = P_f.shape[1]
+    
     # initialize array of beamformer data (angle, time)
-    y_beamformer = np.zeros((N_theta, N_time))
+    y_beamformer = np.zeros((N_theta, N_time), dtype=real)
+    
+    # steer blocks of directions so the phase tensor stays bounded in size
+    block = max(1, max_block_size//(M*N_f))
+    scan_bytes = 0
+    for start in range(0, N_theta, block):
+        # cache only the leading blocks that fit together in the steering cache
+        scan_bytes += len(theta[start:start+block])*M*N_f*complex_.itemsize
+        phases = SensorArrayObj.steering_vectors(theta[start:start+block], fs,
+                                                 N_time, c0, complex_,
+                                                 cache=scan_bytes <= SensorArrayObj.cache_bytes)
+        Y_f = np.einsum('tmf,mf->tf', phases, P_f)
+        y_beamformer[start:start+block] = np.fft.irfft(Y_f, n=N_time, axis=1)
+    
+    # compensate for Nweights / No. of sensors in array
+    y_beamformer *= 1./np.sum(np.asarray(weights)**2)
+    
+    return y_beamformer
 
-    # for each direction...
-    for theta_i in range(N_theta):
+
+class BlockBeamformer:
+    """
+    Block-processing delay-and-sum beamformer for live array input.
+    
+    Multichannel audio is consumed in blocks of 'block_size' samples and
+    steered in the frequency domain with overlap-save, so the delays never wrap
+    around a block edge. Each call to 'process' returns the beamformed block
+    for every steering direction and the steered response power (SRP) of the
+    block, whose maximum tracks the direction of arrival.
+    
+    SensorArrayObj : instance of SensorArray class
+        Instance containing array geometry information
+    
+    theta : (N_theta,) array_like
+        Numpy vector containing set of steering directions, in radians.
+    
+    weights : (M,) array_like
+        Numpy vector containing array amplitude weighting coefficients.
+    
+    fs : int
+        Sampling frequency, in Hz.
+    
+    block_size : int
+        Number of samples per channel in each input block.
+    
+    c0 : float
+        Speed of sound, in meters per second.
+    
+    guard : int
+        Number of samples reserved on both sides of the steering delays for
+        the tails of the fractional-delay interpolation.
+    
+    latency : int
+        Delay of the output relative to the input, in samples. A sample leaves
+        the beamformer at most 'block_size + latency' samples after it enters.
+    
+    dtype : numpy dtype
+        Precision of the computation, as in 'delayandsum_beamformer'. The
+        default, None, follows each input block, so float32 blocks are
+        beamformed in single precision.
+    """
+    
+    def __init__(self, SensorArrayObj, theta, weights, fs, block_size,
+                 c0=1500, guard=32, dtype=None):
+        self.theta = np.asarray(theta)
+        self.block_size = block_size
+        self.M = SensorArrayObj.M
+        self.dtype = dtype
+        
+        # largest steering delay over all sensors and directions, in samples;
+        # delaying the output by 'latency' makes every steering delay causal
+        self.latency = int(np.ceil(SensorArrayObj.max_delay(c0)*fs)) + guard
+        
+        # overlap-save: each FFT frame carries 2*latency samples of history
+        self.history_size = 2*self.latency
+        self.N_fft = block_size + self.history_size
+        self.reset()
         
-        # calculate candidate time delays (TDoA) referring to all microphone using its steering direction (DoA)
-        #The time delays due to propagation are given by d *m *cos (theta) /c, where d is the distance of the n-th microphone to the center         of the array and theta is the angle of arrival relative to the array axis.
+        f = frequency_vector(self.N_fft, fs)
+        phases = SensorArrayObj.steering_vectors(self.theta, fs, self.N_fft, c0)
+        bulk_delay = np.exp(-1j*2*np.pi*f*self.latency/fs)
         
-        time_delays = -SensorArrayObj.m*SensorArrayObj.d*np.cos(theta[theta_i])/c0
+        # weighted, bulk-delayed steering filters, (N_theta, M, N_fft//2+1), and
+        # their copies in the complex dtypes of the input blocks, converted once
+        weights = np.asarray(weights)
+        self.filters = phases*(weights[:, None]*bulk_delay/np.sum(weights**2))
+        self.converted = {self.filters.dtype: self.filters}
     
-        # and for each sensor...
-        for m in range(M):
-            # delay and sum signals
-            y_beamformer[theta_i, :] += weights[m]*delay_signal(p_array[m, :], -time_delays[m], fs)
+    def reset(self):
+        # the history takes the dtype of the first block
+        self.history = None
     
-    # compensate for Nweights / No. of sensors in array
-    y_beamformer *= 1./np.sum(weights**2)
+    def process(self, p_block):
+        """
+        Beamform one block of array signals.
+        
+        Parameters
+        ----------
+        p_block : (M, N_block) array_like
+            Numpy array containing the next 'N_block' samples of each of the
+            'M' array channels, where 'N_block' is 'block_size', or fewer for
+            the last block of a stream. A shorter block is zero-padded, so
+            call 'reset' before starting a new stream.
+        
+        Returns
+        -------
+        y_block : (N_theta, N_block) array_like
+            Beamformer output for each steering direction, delayed by
+            'latency' samples.
+        
+        srp : (N_theta,) array_like
+            Steered response power (mean squared output) of the block for each
+            steering direction.
+        """
+        
+        real, complex_ = float_dtypes(p_block, self.dtype)
+        p_block = np.asarray(p_block, dtype=real)
+        assert p_block.ndim == 2 and p_block.shape[0] == self.M and p_block.shape[1] <= self.block_size, \
+            "Block has shape {}, expected ({}, N_block) with N_block <= {}".format(
+                p_block.shape, self.M, self.block_size)
+        N_block = p_block.shape[1]
+        if N_block < self.block_size:
+            p_block = np.pad(p_block, ((0, 0), (0, self.block_size - N_block)))
+        if self.history is None:
+            self.history = np.zeros((self.M, self.history_size), dtype=real)
+        if complex_ not in self.converted:
+            self.converted[complex_] = self.filters.astype(complex_)
+        
+        frame = np.concatenate((self.history.astype(real, copy=False), p_block), axis=1)
+        self.history = frame[:, -self.history_size:]
+        
+        X_f = np.fft.rfft(frame, axis=1)
+        Y_f = np.einsum('tmf,mf->tf', self.converted[complex_], X_f)
+        
+        # the first 'history_size' samples hold the circular wrap-around
+        y_block = np.fft.irfft(Y_f, n=self.N_fft, axis=1)[:, self.history_size:self.history_size+N_block]
+        srp = np.mean(y_block**2, axis=1)
+        
+        return y_block, srp
     
-    return y_beamformer
-
+    def doa(self, srp):
+        """
+        Direction of arrival, in radians, at the maximum of a steered response
+        power map returned by 'process'.
+        """
+        
+        return self.theta[np.argmax(srp)]
@@ -1,8 +1,133 @@
 import torch
-from frontend import PreProcessing, PostProcessing
+from torch.nn.utils.rnn import PackedSequence, pack_padded_sequence, pad_packed_sequence, pad_sequence
+# frontend.py, and with it torchaudio, is imported when the first model is built, so that
+# importing this module only loads torch
+
+
+def _cat_features(*features):
+    # concatenate GRU inputs and outputs along the feature axis, for tensors or packed sequences
+    if isinstance(features[0], PackedSequence):
+        return features[0]._replace(data=torch.cat([f.data for f in features],dim=-1))
+    return torch.cat(features,dim=-1)
+
+def _map_features(module, features):
+    # apply a frame-wise module to a tensor or to the frames of a packed sequence
+    if isinstance(features, PackedSequence):
+        return features._replace(data=module(features.data))
+    return module(features)
+
+
+class EnhancerBase(torch.nn.Module):
+    """
+    Shared forward passes of the enhancers. Subclasses build the preprocessor,
+    postprocessor and networks, list their GRUs in 'recurrent_modules' and
+    implement _gains(input_features, states=None), which maps magnitude features
+    of shape (frames, batch, features) or a PackedSequence of them to spectral
+    gains of the same layout, together with the final GRU states. Given states,
+    the GRUs continue from them. Single utterances are passed as a batch of one,
+    which dynamically quantized GRUs require.
+    """
+
+    recurrent_modules = ()
+
+    def initial_states(self) -> tuple:
+        # zero hidden state of each GRU in 'recurrent_modules', for a batch of one, on the device
+        # of the frontend buffers, which follows .to() unlike the 'device' given when built (the
+        # packed weights of dynamically quantized GRUs are not parameters to take it from)
+        device = self.preprocessor.spec.window.device
+        return tuple(
+            torch.zeros(gru.num_layers, 1, gru.hidden_size, device=device)
+            for gru in (getattr(self, name) for name in self.recurrent_modules)
+        )
+
+    def output_length(self, input_length: int) -> int:
+        # number of samples forward() returns for input_length samples, e.g. to allocate 'out'
+        resample, spec = self.preprocessor.resample, self.preprocessor.spec
+        length = -(-input_length*resample.new_freq//resample.orig_freq)
+        padding = spec.n_fft - 2*(spec.n_fft//2)
+        length = ((length-padding)//spec.hop_length)*spec.hop_length + padding
+        resample = self.postprocessor.resample
+        return -(-length*resample.new_freq//resample.orig_freq)
+
+    def forward(self, waveform: torch.Tensor, smoothing:torch.Tensor=None, out:torch.Tensor=None) -> torch.Tensor:
+        # the STFT, gains and ISTFT all run on the device of the model. Given 'out', of
+        # output_length() samples, the result is written into it: on the device of the model
+        # the ISTFT or resampling writes there directly, on another device, e.g. a pinned host
+        # buffer, the result is copied into it
+        input_spec = self.preprocessor(waveform)
+        input_features = input_spec.abs()
+
+        gains,_ = self._gains(input_features[:,None])
+        gains = gains[:,0]
+
+        estimated_spec = input_spec * gains
 
+        reconstructed = self.postprocessor(estimated_spec, out)
+        return reconstructed
+
+    def forward_batch(self, waveforms: list) -> list:
+        # spectrograms are computed per utterance so that each matches forward() exactly,
+        # then all utterances go through the networks in one packed pass
+        input_specs = [self.preprocessor(waveform) for waveform in waveforms]
+        lengths = torch.tensor([spec.shape[0] for spec in input_specs])
+
+        input_features = pad_sequence([spec.abs() for spec in input_specs])
+        packed_features = pack_padded_sequence(input_features, lengths, enforce_sorted=False)
+        packed_gains,_ = self._gains(packed_features)
+        gains,_ = pad_packed_sequence(packed_gains, total_length=input_features.shape[0])
+
+        return [
+            self.postprocessor(spec * gains[:spec.shape[0],n])
+            for n,spec in enumerate(input_specs)
+        ]
 
-class SimpleEnhancer(torch.nn.Module):
+    def pass_through(self, waveform: torch.Tensor) -> torch.Tensor:
+        input_spec = self.preprocessor(waveform)
+        reconstructed = self.postprocessor(input_spec)
+        return reconstructed
+
+
+class StreamingEnhancer:
+    """
+    Stateful streaming inference with an enhancer. Audio is fed in arbitrary-sized
+    chunks, typically one hop (half a window) at a time, and process() returns the
+    enhanced samples completed so far, one frame behind the input. The GRU states
+    and the STFT/ISTFT overlap buffers are carried across calls, so the cost per
+    frame is constant. flush() returns the last frame at the end of the stream.
+
+    The GRUs run causally from zero states. SimpleEnhancer.forward() instead warms
+    its GRU up on the whole utterance, so the two differ until the state settles.
+    """
+
+    def __init__(self, enhancer: EnhancerBase):
+        from frontend import StreamingPreProcessing, StreamingPostProcessing
+        self.enhancer = enhancer
+        self.preprocessor = StreamingPreProcessing(enhancer.preprocessor)
+        self.postprocessor = StreamingPostProcessing(enhancer.postprocessor)
+        self.reset()
+
+    def reset(self):
+        self.preprocessor.reset()
+        self.postprocessor.reset()
+        self.states = self.enhancer.initial_states()
+
+    @torch.no_grad()
+    def process(self, chunk: torch.Tensor) -> torch.Tensor:
+        input_spec = self.preprocessor(chunk)
+        if input_spec.shape[0] == 0:
+            return self.postprocessor(input_spec)
+        gains,self.states = self.enhancer._gains(input_spec.abs()[:,None], self.states)
+        gains = gains[:,0]
+
+        estimated_spec = input_spec * gains
+        return self.postprocessor(estimated_spec)
+
+    def flush(self) -> torch.Tensor:
+        # half a frame of zeros in place of the centered padding at the end
+        return self.process(torch.zeros(self.preprocessor.n_fft//2))
+
+
+class SimpleEnhancer(EnhancerBase):
     def __init__(
         self,
         input_samplerate    = 16000,
@@ -10,17 +135,20 @@ class SimpleEnhancer(torch.nn.Module):
         window_length_ms    = 30,
         device              = 'cpu'
     ):
+        from frontend import PreProcessing, PostProcessing
         super().__init__()
         self.device       = device
         self.preprocessor = PreProcessing(
             input_samplerate    = input_samplerate, 
             resample_samplerate  = resample_samplerate, 
-            window_length_ms     = window_length_ms
+            window_length_ms     = window_length_ms,
+            device               = device
         )
         self.postprocessor = PostProcessing(
             output_samplerate   = input_samplerate, 
             resample_samplerate = resample_samplerate, 
-            window_length_ms    = window_length_ms
+            window_length_ms    = window_length_ms,
+            device              = device
         )
 
         self.GRU = torch.nn.GRU(
@@ -38,23 +166,17 @@ class SimpleEnhancer(torch.nn.Module):
         
 
 
-    def forward(self, waveform: torch.Tensor, smoothing:torch.Tensor=None) -> torch.Tensor:
-        input_spec = self.preprocessor(waveform).to(self.device)
-        input_features = input_spec.abs()
-
-        _,state = self.GRU(input_features)
-        hidden,_ = self.GRU(input_features,state)
-        gains = self.dense_output(hidden) 
-
-        estimated_spec = input_spec * gains
-
-        reconstructed = self.postprocessor(estimated_spec.to('cpu'))
-        return reconstructed
+    recurrent_modules = ('GRU',)
 
-    def pass_through(self, waveform: torch.Tensor) -> torch.Tensor:
-        input_spec = self.preprocessor(waveform)
-        reconstructed = self.postprocessor(input_spec)
-        return reconstructed
+    def _gains(self, input_features, states=None):
+        if states is None:
+            # offline, the GRU state is first warmed up on the whole utterance
+            _,state = self.GRU(input_features)
+        else:
+            state, = states
+        hidden,state = self.GRU(input_features,state)
+        gains = _map_features(self.dense_output, hidden)
+        return gains, (state,)
 
 
 
@@ -64,6 +186,7 @@ if 0:
     dataset = NoisySpeech(path,device=device)
     noisy_audio,clean_audio,input_samplerate = dataset.__getitem__(0)
     
+    from frontend import PreProcessing, PostProcessing
     preprocessor = PreProcessing(input_samplerate=input_samplerate)
     postprocessor = PostProcessing(output_samplerate=input_samplerate)    
     enhancer = SimpleEnhancer(
@@ -75,7 +198,7 @@ if 0:
     reconstructed = enhancer(noisy_audio)
 
 
-class NoiseModelEnhancer(torch.nn.Module):
+class NoiseModelEnhancer(EnhancerBase):
     def __init__(
         self,
         input_samplerate    = 16000,
@@ -85,17 +208,20 @@ class NoiseModelEnhancer(torch.nn.Module):
         noise_model_size    = 24,
         device              = 'cpu'
     ):
+        from frontend import PreProcessing, PostProcessing
         super().__init__()
         self.device = device
         self.preprocessor = PreProcessing(
             input_samplerate=input_samplerate, 
             resample_samplerate=resample_samplerate, 
-            window_length_ms=window_length_ms
+            window_length_ms=window_length_ms,
+            device=device
         )
         self.postprocessor = PostProcessing(
             output_samplerate=input_samplerate, 
             resample_samplerate=resample_samplerate, 
-            window_length_ms=window_length_ms
+            window_length_ms=window_length_ms,
+            device=device
         )
 
         self.noise_model = torch.nn.GRU(
@@ -118,25 +244,17 @@ class NoiseModelEnhancer(torch.nn.Module):
         
 
 
-    def forward(self, waveform: torch.Tensor, smoothing:torch.Tensor=None) -> torch.Tensor:
-        input_spec = self.preprocessor(waveform).to(self.device)
-        input_features = input_spec.abs()
-
-        noise_estimate,_ = self.noise_model(input_features)        
-        enhancer_features = torch.cat((input_features, noise_estimate),dim=1)
+    recurrent_modules = ('noise_model', 'enhancer')
 
-        hidden,_ = self.enhancer(enhancer_features)
-        gains = self.dense_output(hidden) 
+    def _gains(self, input_features, states=None):
+        noise_state, enhancer_state = (None, None) if states is None else states
 
-        estimated_spec = input_spec * gains
+        noise_estimate,noise_state = self.noise_model(input_features, noise_state)
+        enhancer_features = _cat_features(input_features, noise_estimate)
 
-        reconstructed = self.postprocessor(estimated_spec.to('cpu'))
-        return reconstructed
-
-    def pass_through(self, waveform: torch.Tensor) -> torch.Tensor:
-        input_spec = self.preprocessor(waveform)
-        reconstructed = self.postprocessor(input_spec)
-        return reconstructed
+        hidden,enhancer_state = self.enhancer(enhancer_features, enhancer_state)
+        gains = _map_features(self.dense_output, hidden)
+        return gains, (noise_state, enhancer_state)
 
 if 0:
     # sanity check
@@ -153,7 +271,7 @@ if 0:
     reconstructed = enhancer(noisy_audio)
 
 
-class VADNoiseModelEnhancer(torch.nn.Module):
+class VADNoiseModelEnhancer(EnhancerBase):
     def __init__(
         self,
         input_samplerate=16000,
@@ -164,17 +282,20 @@ class VADNoiseModelEnhancer(torch.nn.Module):
         vad_model_size = 24,
         device='cpu'
     ):
+        from frontend import PreProcessing, PostProcessing
         super().__init__()
         self.device = device
         self.preprocessor = PreProcessing(
             input_samplerate=input_samplerate, 
             resample_samplerate=resample_samplerate, 
-            window_length_ms=window_length_ms
+            window_length_ms=window_length_ms,
+            device=device
         )
         self.postprocessor = PostProcessing(
             output_samplerate=input_samplerate, 
             resample_samplerate=resample_samplerate, 
-            window_length_ms=window_length_ms
+            window_length_ms=window_length_ms,
+            device=device
         )
 
         self.VAD = torch.nn.GRU(
@@ -205,33 +326,22 @@ class VADNoiseModelEnhancer(torch.nn.Module):
         
 
 
-    def forward(self, waveform: torch.Tensor, smoothing:torch.Tensor=None) -> torch.Tensor:
-        input_spec = self.preprocessor(waveform).to(self.device)
-        input_features = input_spec.abs()
-
-        vad_estimate,_ = self.VAD(input_features)
-        vad_output = self.VAD_output(vad_estimate)
+    recurrent_modules = ('VAD', 'noise_model', 'enhancer')
 
-        noise_estimate,_ = self.noise_model(torch.cat(
-            (input_features,
-             vad_estimate),
-            dim=1))
-        hidden,_ = self.enhancer(torch.cat(
-            (input_features,
-             noise_estimate, 
-             vad_estimate),
-            dim=1))
-        gains = self.dense_output(hidden) 
+    def _gains(self, input_features, states=None):
+        vad_state, noise_state, enhancer_state = (None, None, None) if states is None else states
 
-        estimated_spec = input_spec * gains
+        vad_estimate,vad_state = self.VAD(input_features, vad_state)
 
-        reconstructed = self.postprocessor(estimated_spec.to('cpu'))
-        return reconstructed
-
-    def pass_through(self, waveform: torch.Tensor) -> torch.Tensor:
-        input_spec = self.preprocessor(waveform)
-        reconstructed = self.postprocessor(input_spec)
-        return reconstructed
+        noise_estimate,noise_state = self.noise_model(_cat_features(
+            input_features,
+            vad_estimate), noise_state)
+        hidden,enhancer_state = self.enhancer(_cat_features(
+            input_features,
+            noise_estimate, 
+            vad_estimate), enhancer_state)
+        gains = _map_features(self.dense_output, hidden)
+        return gains, (vad_state, noise_state, enhancer_state)
 
 if 0:
     # sanity check
@@ -246,4 +356,26 @@ if 0:
 
     clean_resampled = enhancer.pass_through(clean_audio)
     reconstructed = enhancer(noisy_audio)
- 
\ No newline at end of file
+ 
+
+def load_enhancer(enhancer_class, checkpoint, device='cpu', **kwargs):
+    # build an enhancer and load its trained weights; the frontend window buffers are not
+    # stored in the checkpoints, so only they may be missing
+    enhancer = enhancer_class(device=device, **kwargs)
+    state_dict = torch.load(checkpoint, map_location=device, weights_only=True)
+
+    own_state = enhancer.state_dict()
+    mismatched = [
+        '{} {} != {}'.format(name, tuple(value.shape), tuple(own_state[name].shape))
+        for name,value in state_dict.items()
+        if name in own_state and value.shape != own_state[name].shape
+    ]
+    assert not mismatched, "Checkpoint {} does not fit {} with a {}-bin frontend: {}".format(
+        checkpoint, enhancer_class.__name__, enhancer.preprocessor.output_size, ', '.join(mismatched))
+
+    missing,unexpected = enhancer.load_state_dict(state_dict, strict=False)
+    assert not unexpected, "Unexpected weights in {}: {}".format(checkpoint, unexpected)
+    missing = [name for name in missing if not name.startswith(('preprocessor.','postprocessor.'))]
+    assert not missing, "Missing weights in {}: {}".format(checkpoint, missing)
+
+    return enhancer.eval()
@@ -0,0 +1,198 @@
+import numpy as np
+import os
+import scipy.fft
+import sys
+
+# the framing engine is shared with the Representations chapter
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Representations'))
+from framing import frame_signal
+from precision import float_dtypes
+
+
+def sensor_pairs(M):
+    """
+    Indices of the M(M-1)/2 sensor pairs (i, j) with i < j.
+
+    Returns
+    -------
+    i, j : (M*(M-1)/2,) array_like
+        Numpy vectors of first and second sensor index of each pair.
+    """
+
+    return np.triu_indices(M, 1)
+
+
+def parabolic_peak(cc, max_lag):
+    """
+    Sub-sample peak position of cross-correlations by parabolic interpolation.
+
+    Parameters
+    ----------
+    cc : (..., 2*max_lag+1) array_like
+        Numpy array of cross-correlations over lags -max_lag ... +max_lag.
+
+    max_lag : int
+        Largest lag in 'cc', in samples.
+
+    Returns
+    -------
+    lag : (...,) array_like
+        Peak lag, in (fractional) samples.
+
+    peak : (...,) array_like
+        Interpolated cross-correlation value at the peak.
+    """
+
+    k = np.argmax(cc, axis=-1)
+
+    # neighbours of the peak, clamped at the ends of the lag range
+    y0 = np.take_along_axis(cc, k[..., None], axis=-1)[..., 0]
+    ym = np.take_along_axis(cc, np.maximum(k-1, 0)[..., None], axis=-1)[..., 0]
+    yp = np.take_along_axis(cc, np.minimum(k+1, cc.shape[-1]-1)[..., None], axis=-1)[..., 0]
+
+    curvature = ym - 2*y0 + yp
+    safe = np.where(curvature < 0, curvature, -1.)
+    delta = np.where(curvature < 0, 0.5*(ym - yp)/safe, 0.)
+
+    return k - max_lag + delta, y0 - 0.25*(ym - yp)*delta
+
+
+def gcc_phat(x, fs, max_tau=None, n_fft=None):
+    """
+    Estimate the time difference of arrival (TDOA) of all sensor pairs of a
+    multichannel recording with the generalized cross-correlation with phase
+    transform (GCC-PHAT).
+
+    Parameters
+    ----------
+    x : (M, N) array_like
+        Numpy array containing 'M' channels of sensor signals over time.
+
+    fs : int
+        Sampling frequency, in Hz.
+
+    max_tau : float, optional
+        Largest TDOA searched for, in seconds, e.g. the array aperture divided
+        by the speed of sound. The default is the signal length.
+
+    n_fft : int, optional
+        FFT length. The default is the shortest fast length that avoids
+        circular wrap-around within 'max_tau'.
+
+    Returns
+    -------
+    tau : (M*(M-1)/2,) array_like
+        TDOA of each pair in 'sensor_pairs(M)', in seconds; positive when the
+        second sensor of the pair receives the signal later.
+
+    cc : (M*(M-1)/2, 2*max_lag+1) array_like
+        GCC-PHAT cross-correlation of each pair over lags -max_lag ... max_lag.
+
+    Notes
+    -----
+    Each channel is transformed once. The cross-spectra of all pairs are
+    products of the channel spectra gathered by broadcasting, and all pair
+    cross-correlations come from one batched inverse FFT.
+    """
+
+    x = np.asarray(x)
+    M, N = x.shape
+    max_lag = N-1 if max_tau is None else min(int(np.ceil(max_tau*fs)), N-1)
+    if n_fft is None:
+        n_fft = scipy.fft.next_fast_len(N + max_lag, real=True)
+
+    X_f = scipy.fft.rfft(x, n=n_fft, axis=-1)
+    cc = _gcc_phat_lags(X_f, n_fft, max_lag)
+    lag, _ = parabolic_peak(cc, max_lag)
+
+    return lag/fs, cc
+
+
+def gcc_phat_frames(x, fs, window_length_ms=64, window_step_ms=32, max_tau=None,
+                    max_block_bytes=2**26, workers=None):
+    """
+    Frame-wise GCC-PHAT TDOA estimation of all sensor pairs, for tracking
+    speakers over long multichannel recordings.
+
+    Parameters
+    ----------
+    x : (M, N) array_like
+        Numpy array containing 'M' channels of sensor signals over time.
+
+    fs : int
+        Sampling frequency, in Hz.
+
+    window_length_ms, window_step_ms : float, optional
+        Frame length and step, in milliseconds.
+
+    max_tau : float, optional
+        Largest TDOA searched for, in seconds. The default is half a frame.
+
+    max_block_bytes : int, optional
+        Approximate memory, in bytes, of the pair cross-spectra and
+        cross-correlations of the frames processed at once. The default,
+        64 MiB, holds about 20 frames of 16 channels at 16 kHz.
+
+    workers : int, optional
+        Number of workers passed to 'scipy.fft'.
+
+    Returns
+    -------
+    tau : (M*(M-1)/2, frames) array_like
+        TDOA of each pair in 'sensor_pairs(M)' for each frame, in seconds.
+
+    peak : (M*(M-1)/2, frames) array_like
+        Interpolated GCC-PHAT peak value, a confidence measure in [0, 1].
+
+    Both are float32 for float32 'x', which is processed in single precision.
+    """
+
+    real, complex_ = float_dtypes(x)
+    x = np.asarray(x, dtype=real)
+    M, N = x.shape
+    window_length = int(window_length_ms*fs/1000)
+    window_step = int(window_step_ms*fs/1000)
+    max_lag = window_length//2 if max_tau is None else min(int(np.ceil(max_tau*fs)), window_length-1)
+    n_fft = scipy.fft.next_fast_len(window_length + max_lag, real=True)
+    window = np.hanning(window_length + 2)[1:-1].astype(real)
+
+    # strided (M, frames, window_length) view of all frames
+    frames = frame_signal(x, window_length, window_step)
+    frame_count = frames.shape[1]
+
+    pair_count = M*(M-1)//2
+    tau = np.zeros((pair_count, frame_count), dtype=real)
+    peak = np.zeros((pair_count, frame_count), dtype=real)
+
+    # frames per block from the pair cross-spectra and cross-correlations of one frame
+    frame_bytes = pair_count*((n_fft//2+1)*complex_.itemsize + n_fft*real.itemsize)
+    frames_per_block = max(1, max_block_bytes//max(frame_bytes, 1))
+
+    for start in range(0, frame_count, frames_per_block):
+        block = frames[:, start:start+frames_per_block]*window
+        X_f = scipy.fft.rfft(block, n=n_fft, axis=-1, workers=workers)
+        cc = _gcc_phat_lags(X_f, n_fft, max_lag, workers)
+        lag, value = parabolic_peak(cc, max_lag)
+        tau[:, start:start+frames_per_block] = lag/fs
+        peak[:, start:start+frames_per_block] = value
+
+    return tau, peak
+
+
+def _gcc_phat_lags(X_f, n_fft, max_lag, workers=None):
+    # PHAT-weighted cross-correlations of all pairs over lags -max_lag ... max_lag,
+    # from (M, ..., F) channel spectra. The PHAT weight 1/|conj(X_i)*X_j| is applied to
+    # each channel, so no pair-sized magnitude is formed, and the cross-spectra of the
+    # pairs of each first sensor are written straight into G
+    M = X_f.shape[0]
+    X_f = X_f/np.maximum(np.abs(X_f), 1e-6)
+    G = np.empty(((M*(M-1))//2,) + X_f.shape[1:], dtype=X_f.dtype)
+    row = 0
+    for m in range(M-1):
+        np.multiply(np.conj(X_f[m]), X_f[m+1:], out=G[row:row+M-1-m])
+        row += M-1-m
+
+    # G is not used after the inverse FFT, which may overwrite it
+    cc = scipy.fft.irfft(G, n=n_fft, axis=-1, workers=workers, overwrite_x=True)
+    del G
+    return np.concatenate((cc[..., n_fft-max_lag:], cc[..., :max_lag+1]), axis=-1)
@@ -0,0 +1,35 @@
+# WAV input and output shared by the batch enhancement CLI, the training dataset
+# and the quantization calibration; samples are streamed as float32 torch chunks.
+import wave
+import numpy as np
+import scipy.io.wavfile as wavfile
+import torch
+
+
+def read_wav(filename):
+    # memory-mapped samples, or a regular read for formats numpy cannot map, such as 24-bit
+    try:
+        return wavfile.read(filename, mmap=True)
+    except ValueError:
+        return wavfile.read(filename)
+
+def wav_chunks(data, chunk_samples):
+    # mono float32 chunks in [-1, 1); only one chunk of the mapped samples is converted at a time
+    for start in range(0, data.shape[0], chunk_samples):
+        chunk = np.asarray(data[start:start+chunk_samples])
+        if np.issubdtype(chunk.dtype, np.integer):
+            info = np.iinfo(chunk.dtype)
+            chunk = (chunk.astype(np.float64) - (info.max+info.min+1)/2) / ((info.max-info.min+1)/2)
+        if chunk.ndim > 1:
+            chunk = np.mean(chunk, axis=1)
+        yield torch.from_numpy(chunk.astype(np.float32))
+
+def write_wav(filename, fs, chunks):
+    # 16-bit mono PCM, written chunk by chunk
+    with wave.open(filename, 'wb') as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(fs)
+        for chunk in chunks:
+            samples = np.clip(np.round(chunk.cpu().numpy()*32768), -32768, 32767).astype('<i2')
+            output.writeframes(samples.tobytes())
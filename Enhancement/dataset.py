@@ -0,0 +1,128 @@
+import json
+import os
+import numpy as np
+import torch
+from frontend import PreProcessing
+from audio_io import read_wav, wav_chunks
+
+
+# On-disk store of precomputed spectrograms. Noisy and clean spectrograms of all
+# utterances are concatenated along the frame axis into complex64 shards
+#   noisy_00000.npy, clean_00000.npy, ...   of shape (frames, bins)
+# with index.npy holding one row (shard, start frame, frame count, samplerate) per
+# utterance and store.json holding the frontend parameters.
+
+
+def wav_pairs(noisy_dir, clean_dir):
+    # (noisy, clean, samplerate) of the WAV files present under the same name in both directories
+    for name in sorted(os.listdir(noisy_dir)):
+        clean_path = os.path.join(clean_dir, name)
+        if not name.lower().endswith('.wav') or not os.path.exists(clean_path):
+            continue
+        fs, noisy = read_wav(os.path.join(noisy_dir, name))
+        clean_fs, clean = read_wav(clean_path)
+        assert fs == clean_fs, "Sampling rates of {} differ".format(name)
+        yield torch.cat(list(wav_chunks(noisy, max(1, len(noisy))))), torch.cat(list(wav_chunks(clean, max(1, len(clean))))), fs
+
+
+def precompute_spectrograms(pairs, store_dir, resample_samplerate=16000, window_length_ms=30, shard_frames=2**18):
+    """
+    Compute the PreProcessing spectrograms of noisy and clean utterances once and
+    write them to a spectrogram store in 'store_dir'. 'pairs' is any iterable of
+    (noisy_audio, clean_audio, samplerate), such as a NoisySpeech dataset or
+    wav_pairs(). Shards are written once they hold at least 'shard_frames' frames.
+    Returns the number of utterances stored.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    preprocessors = {}
+    index, noisy_shard, clean_shard = [], [], []
+    shard, start = 0, 0
+
+    def write_shard():
+        np.save(os.path.join(store_dir, 'noisy_{:05d}.npy'.format(shard)), np.concatenate(noisy_shard))
+        np.save(os.path.join(store_dir, 'clean_{:05d}.npy'.format(shard)), np.concatenate(clean_shard))
+
+    with torch.inference_mode():
+        for noisy_audio, clean_audio, fs in pairs:
+            if fs not in preprocessors:
+                preprocessors[fs] = PreProcessing(
+                    input_samplerate=fs, resample_samplerate=resample_samplerate, window_length_ms=window_length_ms)
+            noisy_spec = preprocessors[fs](torch.as_tensor(noisy_audio, dtype=torch.float32).cpu())
+            clean_spec = preprocessors[fs](torch.as_tensor(clean_audio, dtype=torch.float32).cpu())
+            assert noisy_spec.shape == clean_spec.shape, "Noisy and clean audio differ in length"
+
+            noisy_shard.append(noisy_spec.numpy().astype(np.complex64))
+            clean_shard.append(clean_spec.numpy().astype(np.complex64))
+            index.append((shard, start, noisy_spec.shape[0], fs))
+            start += noisy_spec.shape[0]
+            if start >= shard_frames:
+                write_shard()
+                shard, start, noisy_shard, clean_shard = shard+1, 0, [], []
+
+    if noisy_shard:
+        write_shard()
+        shard += 1
+
+    np.save(os.path.join(store_dir, 'index.npy'), np.array(index, dtype=np.int64).reshape(-1, 4))
+    with open(os.path.join(store_dir, 'store.json'), 'w') as f:
+        json.dump({'resample_samplerate': resample_samplerate, 'window_length_ms': window_length_ms,
+                   'bins': next(iter(preprocessors.values())).output_size if preprocessors else 0,
+                   'shards': shard}, f)
+    return len(index)
+
+
+class SpectrogramCrops(torch.utils.data.Dataset):
+    """
+    Random fixed-length crops of the utterances in a spectrogram store. Item i is
+    a crop of utterance i at a start drawn anew on every access, as
+    (noisy_spec, clean_spec, length): complex64 tensors of shape
+    (crop_frames, bins), zero-padded after 'length' valid frames when the
+    utterance is shorter than the crop. The shards are memory-mapped on first
+    access in each DataLoader worker, so only the crops are read from disk.
+    """
+
+    def __init__(self, store_dir, crop_frames=200):
+        self.store_dir = store_dir
+        self.crop_frames = crop_frames
+        with open(os.path.join(store_dir, 'store.json')) as f:
+            self.metadata = json.load(f)
+        self.index = np.load(os.path.join(store_dir, 'index.npy'))
+        self.shards = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def _open_shards(self):
+        self.shards = [
+            (np.load(os.path.join(self.store_dir, 'noisy_{:05d}.npy'.format(shard)), mmap_mode='r'),
+             np.load(os.path.join(self.store_dir, 'clean_{:05d}.npy'.format(shard)), mmap_mode='r'))
+            for shard in range(self.metadata['shards'])
+        ]
+
+    def __getitem__(self, i):
+        if self.shards is None:
+            self._open_shards()
+        shard, start, frames, _ = self.index[i]
+        noisy, clean = self.shards[shard]
+
+        # torch draws a different random stream in each DataLoader worker
+        length = min(int(frames), self.crop_frames)
+        offset = start + int(torch.randint(int(frames) - length + 1, ()))
+        noisy_crop = np.zeros((self.crop_frames, noisy.shape[1]), dtype=np.complex64)
+        clean_crop = np.zeros((self.crop_frames, clean.shape[1]), dtype=np.complex64)
+        noisy_crop[:length] = noisy[offset:offset+length]
+        clean_crop[:length] = clean[offset:offset+length]
+        return torch.from_numpy(noisy_crop), torch.from_numpy(clean_crop), length
+
+
+def collate_crops(items):
+    # (frames, batch, bins) spectrograms, the layout of the enhancer GRUs, and the valid lengths
+    noisy, clean, lengths = zip(*items)
+    return torch.stack(noisy, dim=1), torch.stack(clean, dim=1), torch.tensor(lengths)
+
+
+def spectrogram_loader(store_dir, crop_frames=200, batch_size=32, num_workers=4, shuffle=True, **kwargs):
+    # multi-worker DataLoader of random crops; extra keyword arguments go to the DataLoader
+    return torch.utils.data.DataLoader(
+        SpectrogramCrops(store_dir, crop_frames), batch_size=batch_size, shuffle=shuffle,
+        num_workers=num_workers, collate_fn=collate_crops, persistent_workers=num_workers > 0, **kwargs)
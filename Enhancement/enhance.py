@@ -0,0 +1,177 @@
+import argparse
+import concurrent.futures
+import csv
+import multiprocessing
+import os
+import sys
+import time
+import torch
+import Enhancer
+from audio_io import read_wav, wav_chunks, write_wav
+
+
+MODELS = ('SimpleEnhancer', 'NoiseModelEnhancer', 'VADNoiseModelEnhancer')
+REPORT_FIELDS = ('file', 'model', 'checkpoint', 'mode', 'samplerate', 'seconds', 'processing_seconds', 'rtf', 'status')
+
+
+def find_wavs(input_dir, exclude_dir=None):
+    # WAV files under input_dir in sorted order, skipping exclude_dir (e.g. an output directory inside it)
+    for root, dirs, files in os.walk(input_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != exclude_dir)
+        for name in sorted(files):
+            if name.lower().endswith('.wav'):
+                yield os.path.join(root, name)
+
+def read_report(report):
+    # rows of earlier runs by input file, empty when there is no report yet
+    if not os.path.exists(report):
+        return {}
+    with open(report, newline='') as f:
+        return {row['file']: row for row in csv.DictReader(f)}
+
+def up_to_date(input_path, output_path, checkpoint=None, previous=None, settings=None):
+    # the output is newer than the input and checkpoint, and was enhanced by an earlier run
+    # whose report row has the same settings (model, checkpoint and mode)
+    if not os.path.exists(output_path) or previous is None or previous.get('status') != 'enhanced':
+        return False
+    if any(previous.get(key) != value for key, value in (settings or {}).items()):
+        return False
+    newest = os.path.getmtime(input_path)
+    if checkpoint is not None:
+        newest = max(newest, os.path.getmtime(checkpoint))
+    return os.path.getmtime(output_path) >= newest
+
+
+# per-process state of the pool workers
+_worker = {}
+
+def init_worker(model, checkpoint, threads):
+    torch.set_num_threads(threads)
+    _worker.update(model=model, checkpoint=checkpoint, enhancers={})
+
+def _enhancer(fs):
+    # one enhancer per input sampling rate, built on first use in each worker
+    enhancers = _worker['enhancers']
+    if fs not in enhancers:
+        enhancer_class = getattr(Enhancer, _worker['model'])
+        if _worker['checkpoint'] is None:
+            # the same fresh weights in every worker
+            torch.manual_seed(0)
+            enhancers[fs] = enhancer_class(input_samplerate=fs).eval()
+        else:
+            enhancers[fs] = Enhancer.load_enhancer(enhancer_class, _worker['checkpoint'], input_samplerate=fs)
+    return enhancers[fs]
+
+def _streamed(enhancer, chunks):
+    stream = Enhancer.StreamingEnhancer(enhancer)
+    for chunk in chunks:
+        yield stream.process(chunk)
+    yield stream.flush()
+
+def enhance_file(input_path, output_path, chunk_seconds=10., streaming=False):
+    """
+    Enhance one WAV file with the worker's model and write a 16-bit WAV at the
+    input sampling rate. The input is memory-mapped and converted chunk by chunk;
+    with streaming, the chunks also pass through StreamingEnhancer one at a time,
+    which needs matching input and model rates. The output is written to a
+    temporary file first, so an interrupted run leaves no up-to-date output.
+    """
+    start = time.perf_counter()
+    fs, data = read_wav(input_path)
+    enhancer = _enhancer(fs)
+    chunks = wav_chunks(data, max(1, int(chunk_seconds*fs)))
+
+    partial_path = output_path + '.part'
+    try:
+        with torch.inference_mode():
+            if streaming:
+                write_wav(partial_path, fs, _streamed(enhancer, chunks))
+            else:
+                waveform = torch.empty(data.shape[0])
+                position = 0
+                for chunk in chunks:
+                    waveform[position:position+len(chunk)] = chunk
+                    position += len(chunk)
+                write_wav(partial_path, fs, [enhancer(waveform)])
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    os.replace(partial_path, output_path)
+
+    elapsed = time.perf_counter() - start
+    seconds = data.shape[0]/fs
+    return {'file': input_path, 'samplerate': fs, 'seconds': seconds,
+            'processing_seconds': elapsed, 'rtf': elapsed/seconds if seconds else 0., 'status': 'enhanced'}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Enhance all WAV files under a directory in parallel.')
+    parser.add_argument('model', choices=MODELS)
+    parser.add_argument('checkpoint', nargs='?', help='trained weights; fixed-seed initial weights if omitted')
+    parser.add_argument('input_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, by default CPU cores / threads')
+    parser.add_argument('--threads', type=int, default=1, help='torch intra-op threads per worker')
+    parser.add_argument('--chunk-seconds', type=float, default=10.)
+    parser.add_argument('--streaming', action='store_true', help='enhance with constant memory through StreamingEnhancer')
+    parser.add_argument('--force', action='store_true', help='also enhance files whose outputs are up to date')
+    parser.add_argument('--report', help='CSV report, by default enhancement_report.csv in the output directory')
+    args = parser.parse_args(argv)
+
+    output_dir = os.path.abspath(args.output_dir)
+    workers = args.workers or max(1, (os.cpu_count() or 1)//args.threads)
+    report = args.report or os.path.join(output_dir, 'enhancement_report.csv')
+    settings = {'model': args.model,
+                'checkpoint': os.path.abspath(args.checkpoint) if args.checkpoint else '',
+                'mode': 'streaming' if args.streaming else 'batch'}
+
+    # rows of skipped files, and of files no longer in the input, keep their earlier timings
+    previous = read_report(report)
+    rows, tasks, skipped = [], [], 0
+    for input_path in find_wavs(args.input_dir, exclude_dir=output_dir):
+        output_path = os.path.join(output_dir, os.path.relpath(input_path, args.input_dir))
+        if not args.force and up_to_date(input_path, output_path, args.checkpoint,
+                                         previous.get(input_path), settings):
+            skipped += 1
+            continue
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        tasks.append((input_path, output_path))
+
+    print('{} files to enhance, {} up to date, {} workers x {} threads'.format(
+        len(tasks), skipped, workers, args.threads))
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker, initargs=(args.model, args.checkpoint, args.threads)) as pool:
+        futures = {
+            pool.submit(enhance_file, input_path, output_path, args.chunk_seconds, args.streaming): input_path
+            for input_path, output_path in tasks
+        }
+        for n, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            try:
+                row = future.result()
+            except Exception as error:
+                row = dict(dict.fromkeys(REPORT_FIELDS, 0), file=futures[future], status='failed: {}'.format(error))
+            row.update(settings)
+            rows.append(row)
+            print('[{}/{}] {} {}'.format(n, len(tasks), row['file'],
+                                         'RTF {:.4f}'.format(row['rtf']) if row['status'] == 'enhanced' else row['status']))
+    wall_time = time.perf_counter() - start
+
+    os.makedirs(os.path.dirname(os.path.abspath(report)), exist_ok=True)
+    previous.update((row['file'], row) for row in rows)
+    with open(report, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(row for _, row in sorted(previous.items()))
+
+    enhanced = [row for row in rows if row['status'] == 'enhanced']
+    audio_seconds = sum(row['seconds'] for row in enhanced)
+    print('Enhanced {:.1f} s of audio in {:.1f} s, overall RTF {:.4f}; report in {}'.format(
+        audio_seconds, wall_time, wall_time/audio_seconds if audio_seconds else 0., report))
+    return 0 if all(not row['status'].startswith('failed') for row in rows) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import argparse
+import math
+import torch
+import Enhancer
+
+
+class ExportableEnhancer(torch.nn.Module):
+    """
+    Waveform-to-waveform wrapper of an enhancer for TorchScript and ONNX export.
+
+    The spectrogram and inverse spectrogram of PreProcessing and PostProcessing
+    are computed with real-valued ops only: frames are gathered from hop-sized blocks
+    and transformed by matrix products with precomputed windowed DFT bases, and the
+    inverse overlap-adds a fixed number of hop-sized blocks. The output equals
+    that of enhancer(waveform) up to float32 rounding.
+    """
+
+    def __init__(self, enhancer: Enhancer.EnhancerBase):
+        super().__init__()
+        self.enhancer = enhancer
+        spec = enhancer.preprocessor.spec
+        self.n_fft = spec.n_fft
+        self.hop_length = spec.hop_length
+        self.block_count = -(-self.n_fft//self.hop_length)
+
+        n = torch.arange(self.n_fft, dtype=torch.float64)
+        k = torch.arange(self.n_fft//2+1, dtype=torch.float64)
+        angle = 2*math.pi*torch.outer(n, k)/self.n_fft
+        window = spec.window.to(torch.float64)
+
+        # forward bases (n_fft, bins) include the analysis window; inverse bases (bins, n_fft)
+        # include the one-sided irfft weights and the synthesis window
+        weights = torch.full((len(k),), 2.)
+        weights[0] = 1.
+        if self.n_fft % 2 == 0:
+            weights[-1] = 1.
+        inverse_window = enhancer.postprocessor.invspec.window.to(torch.float64)
+        self.register_buffer('cos_basis', (window[:,None]*torch.cos(angle)).float())
+        self.register_buffer('sin_basis', (-window[:,None]*torch.sin(angle)).float())
+        self.register_buffer('inverse_cos_basis', (weights[:,None]*torch.cos(angle.T)*inverse_window/self.n_fft).float())
+        self.register_buffer('inverse_sin_basis', (-weights[:,None]*torch.sin(angle.T)*inverse_window/self.n_fft).float())
+        self.register_buffer('window_squared', (inverse_window**2).float())
+
+    def _frames(self, signal: torch.Tensor) -> torch.Tensor:
+        # (frames, n_fft) frames at hop_length, gathered from hop-sized blocks without unfold;
+        # the zeros appended complete the blocks of the last frame when n_fft is not a multiple
+        signal = torch.nn.functional.pad(signal, (0, self.block_count*self.hop_length - self.n_fft))
+        blocks = signal[:(signal.shape[0]//self.hop_length)*self.hop_length].reshape(-1, self.hop_length)
+        frames = torch.cat([
+            blocks[b:blocks.shape[0]-(self.block_count-1-b)]
+            for b in range(self.block_count)
+        ], dim=-1)
+        return frames[:,:self.n_fft]
+
+    def _overlap_add(self, frames: torch.Tensor) -> torch.Tensor:
+        # sum (frames, n_fft) at hop_length, one hop-sized block offset at a time
+        blocks = torch.nn.functional.pad(frames, (0, self.block_count*self.hop_length - self.n_fft))
+        blocks = blocks.reshape(frames.shape[0], self.block_count, self.hop_length)
+        signal = torch.nn.functional.pad(blocks[:,0].reshape(-1), (0, (self.block_count-1)*self.hop_length))
+        for b in range(1, self.block_count):
+            signal = signal + torch.nn.functional.pad(
+                blocks[:,b].reshape(-1), (b*self.hop_length, (self.block_count-1-b)*self.hop_length))
+        return signal
+
+    def forward(self, waveform: torch.Tensor) -> torch.Tensor:
+        resampled = self.enhancer.preprocessor.resample(waveform)
+
+        # centered frames with reflect padding, as in torchaudio's Spectrogram
+        padded = torch.nn.functional.pad(resampled[None,None], (self.n_fft//2, self.n_fft//2), mode='reflect')[0,0]
+        frames = self._frames(padded)
+        real = frames @ self.cos_basis
+        imag = frames @ self.sin_basis
+
+        # a batch of one, as in EnhancerBase.forward()
+        gains,_ = self.enhancer._gains(torch.sqrt(real**2 + imag**2)[:,None])
+        gains = gains[:,0]
+        frames = (real*gains) @ self.inverse_cos_basis + (imag*gains) @ self.inverse_sin_basis
+
+        # normalize by the overlap-added squared window and trim the centered padding
+        signal = self._overlap_add(frames)
+        envelope = self._overlap_add(self.window_squared.expand_as(frames))
+        tail = self.block_count*self.hop_length - self.n_fft + self.n_fft//2
+        signal = signal[self.n_fft//2:signal.shape[0]-tail] / envelope[self.n_fft//2:envelope.shape[0]-tail].clamp_min(1e-11)
+
+        return self.enhancer.postprocessor.resample(signal)
+
+
+def export_torchscript(enhancer, path, example_length=16000):
+    # traced and frozen graph, loadable with torch.jit.load() alone
+    module = ExportableEnhancer(enhancer).eval()
+    example = torch.randn(example_length)
+    with torch.inference_mode():
+        traced = torch.jit.trace(module, (example,), check_inputs=[(torch.randn(example_length//2+1),)])
+        frozen = torch.jit.freeze(traced)
+    frozen.save(path)
+    return frozen
+
+
+def export_onnx(enhancer, path, example_length=16000, opset_version=18):
+    # ONNX graph with a dynamic number of samples; the TorchScript-based exporter is used, as
+    # the dynamo exporter cannot decompose a GRU whose sequence length is derived from the input
+    module = ExportableEnhancer(enhancer).eval()
+    example = torch.randn(example_length)
+    with torch.inference_mode():
+        torch.onnx.export(
+            module, (example,), path,
+            input_names=['waveform'], output_names=['enhanced'],
+            dynamic_axes={'waveform': {0: 'samples'}, 'enhanced': {0: 'enhanced_samples'}},
+            opset_version=opset_version, dynamo=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export an enhancer checkpoint to TorchScript or ONNX.')
+    parser.add_argument('model', choices=['SimpleEnhancer', 'NoiseModelEnhancer', 'VADNoiseModelEnhancer'])
+    parser.add_argument('checkpoint')
+    parser.add_argument('output', help='output file, ending in .onnx for ONNX and TorchScript otherwise')
+    parser.add_argument('--input-samplerate', type=int, default=16000)
+    args = parser.parse_args()
+
+    enhancer = Enhancer.load_enhancer(
+        getattr(Enhancer, args.model), args.checkpoint, input_samplerate=args.input_samplerate)
+    if args.output.endswith('.onnx'):
+        export_onnx(enhancer, args.output)
+    else:
+        export_torchscript(enhancer, args.output)
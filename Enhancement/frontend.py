@@ -1,25 +1,104 @@
+import functools
+import math
 import torchaudio
 import torch
-import scipy
+
+
+# Resampling kernels and STFT windows are computed once per parameter set and cached, and each
+# frontend module receives its own copy as a buffer, so that in-place changes to one model
+# (load_state_dict(), in-place moves) never reach the others. The cached tensors and the
+# copies are made outside inference mode, so a frontend built under torch.inference_mode(),
+# e.g. while precomputing spectrograms, does not leave inference tensors for later training.
+
+@functools.lru_cache(maxsize=32)
+def _resample_kernel(orig_freq, new_freq):
+    with torch.inference_mode(False):
+        resample = torchaudio.transforms.Resample(orig_freq=orig_freq, new_freq=new_freq)
+    return resample.kernel, resample.width
+
+@functools.lru_cache(maxsize=32)
+def _hann_window(window_length):
+    with torch.inference_mode(False):
+        return torch.hann_window(window_length)
+
+def resample_kernel(orig_freq, new_freq):
+    kernel, width = _resample_kernel(orig_freq, new_freq)
+    with torch.inference_mode(False):
+        return kernel.clone(), width
+
+def hann_window(window_length):
+    with torch.inference_mode(False):
+        return _hann_window(window_length).clone()
+
+
+class CachedResample(torchaudio.transforms.Resample):
+    """
+    torchaudio Resample with the default sinc interpolation, whose kernel comes
+    from resample_kernel(). Matching rates build no kernel and return the
+    waveform unchanged. Given 'out', a 1-D waveform is resampled straight into
+    it, with one matrix product of the strided input frames and the kernel in
+    place of the convolution.
+    """
+
+    def __init__(self, orig_freq=16000, new_freq=16000):
+        torch.nn.Module.__init__(self)
+        self.orig_freq = orig_freq
+        self.new_freq = new_freq
+        self.gcd = math.gcd(int(orig_freq), int(new_freq))
+        self.resampling_method = 'sinc_interp_hann'
+        self.lowpass_filter_width = 6
+        self.rolloff = 0.99
+        self.beta = None
+        if orig_freq != new_freq:
+            kernel, self.width = resample_kernel(orig_freq, new_freq)
+            self.register_buffer('kernel', kernel)
+
+    def forward(self, waveform: torch.Tensor, out: torch.Tensor = None) -> torch.Tensor:
+        if out is not None:
+            return self._resample_into(waveform, out)
+        if self.orig_freq == self.new_freq:
+            return waveform
+        return super().forward(waveform)
+
+    def _resample_into(self, waveform, out):
+        # as torchaudio's sinc resampling: output block n is the kernel applied to the
+        # padded input at n*orig_freq, here one row of a (blocks, new_freq) product
+        if self.orig_freq == self.new_freq:
+            return out.copy_(waveform)
+        orig_freq, new_freq = self.orig_freq//self.gcd, self.new_freq//self.gcd
+        kernel = self.kernel[:,0].mT
+        length = -(-new_freq*waveform.shape[-1]//orig_freq)
+        assert out.shape == (length,), "Output buffer has shape {}, expected {}".format(tuple(out.shape), (length,))
+
+        padded = torch.nn.functional.pad(waveform, (self.width, self.width + orig_freq))
+        frames = padded.unfold(-1, kernel.shape[0], orig_freq)
+        rows = length//new_freq
+        torch.matmul(frames[:rows], kernel, out=out[:rows*new_freq].view(rows, new_freq))
+        if length > rows*new_freq:
+            out[rows*new_freq:] = (frames[rows] @ kernel)[:length-rows*new_freq]
+        return out
+
 
 class PreProcessing(torch.nn.Module):
     def __init__(
         self,
         input_samplerate    = 16000,
         resample_samplerate = 16000,
-        window_length_ms    = 30
+        window_length_ms    = 30,
+        device              = 'cpu'
     ):
         super().__init__()
-        self.resample = torchaudio.transforms.Resample(orig_freq=input_samplerate, new_freq=resample_samplerate)
+        self.resample = CachedResample(orig_freq=input_samplerate, new_freq=resample_samplerate)
         n_fft = (2*window_length_ms * resample_samplerate) // 2000
         hop_length = n_fft // 2
-        self.spec = torchaudio.transforms.Spectrogram(n_fft=n_fft,power=None,hop_length=hop_length)
+        self.spec = torchaudio.transforms.Spectrogram(n_fft=n_fft,power=None,hop_length=hop_length,window_fn=hann_window)
         self.output_size = (n_fft+2)//2
+        self.to(device)
 
 
     def forward(self, waveform: torch.Tensor) -> torch.Tensor:
-        # Resample the input
-        resampled = self.resample(waveform)
+        # Move the input to the device of the frontend and resample it
+        resampled = self.resample(waveform.to(self.spec.window.device))
 
         # Convert to power spectrogram
         spec = self.spec(resampled).mT
@@ -33,22 +112,155 @@ class PostProcessing(torch.nn.Module):
         self,
         output_samplerate   = 16000,
         resample_samplerate = 16000,
-        window_length_ms    = 30
+        window_length_ms    = 30,
+        device              = 'cpu'
     ):
         super().__init__()
-        self.resample = torchaudio.transforms.Resample(orig_freq=resample_samplerate, new_freq=output_samplerate)
+        self.resample = CachedResample(orig_freq=resample_samplerate, new_freq=output_samplerate)
         n_fft = (2*window_length_ms * resample_samplerate) // 2000
         hop_length = n_fft // 2
-        self.invspec = torchaudio.transforms.InverseSpectrogram(n_fft=n_fft,hop_length=hop_length)
+        self.invspec = torchaudio.transforms.InverseSpectrogram(n_fft=n_fft,hop_length=hop_length,window_fn=hann_window)
+        self.to(device)
 
 
-    def forward(self, spec: torch.Tensor) -> torch.Tensor:
-        # Convert to power spectrogram
+    def forward(self, spec: torch.Tensor, out: torch.Tensor = None) -> torch.Tensor:
+        # Move the spectrogram to the device of the frontend and convert it to a waveform. Given
+        # 'out' on the same device, the last stage, the resampling or else the inverse
+        # spectrogram, writes straight into it; on another device the result is copied there
+        spec = spec.to(self.invspec.window.device)
+        if out is not None and out.device != spec.device:
+            result = self(spec)
+            assert out.shape == result.shape, "Output buffer has shape {}, expected {}".format(
+                tuple(out.shape), tuple(result.shape))
+            return out.copy_(result)
+        if out is not None and self.resample.orig_freq == self.resample.new_freq:
+            return self._invspec_into(spec, out)
+
         waveform = self.invspec(spec.mT)
 
         # Resample the output
-        resampled = self.resample(waveform)
+        resampled = self.resample(waveform, out)
 
         return resampled
 
+    def _invspec_into(self, spec, out):
+        # the centered inverse spectrogram of torch.istft, overlap-added into 'out' one
+        # hop-sized block offset at a time and divided by the overlap-added squared window
+        n_fft, hop = self.invspec.n_fft, self.invspec.hop_length
+        window = self.invspec.window
+        frame_count = spec.shape[0]
+        offset = n_fft//2
+        length = max(0, (frame_count-1)*hop + n_fft - 2*offset)
+        assert out.shape == (length,), "Output buffer has shape {}, expected {}".format(tuple(out.shape), (length,))
+
+        out.zero_()
+        if frame_count:
+            _overlap_add_into(torch.fft.irfft(spec, n=n_fft, dim=-1)*window, hop, offset, out)
+
+        # the envelope is periodic with period hop away from the ends, so it is overlap-added
+        # for at most 2*blocks frames, whose ends equal those of the full envelope
+        blocks = -(-n_fft//hop)
+        count = min(frame_count, 2*blocks)
+        envelope = torch.zeros((count-1)*hop + n_fft, device=out.device, dtype=out.dtype)
+        _overlap_add_into((window**2).expand(count, n_fft), hop, 0, envelope)
+        if count < 2*blocks:
+            return out.div_(envelope[offset:offset+length])
+        head, tail = blocks*hop - offset, (frame_count-blocks)*hop - offset
+        out[:head].div_(envelope[offset:blocks*hop])
+        out[head:tail].view(-1, hop).div_(envelope[blocks*hop:(blocks+1)*hop])
+        out[tail:].div_(envelope[blocks*hop:blocks*hop+length-tail])
+        return out
+
+
+def _overlap_add_into(frames, hop, offset, out):
+    # out[t*hop + i - offset] += frames[t, i], skipping positions outside 'out'; the hop-sized
+    # blocks of all frames at one offset form a contiguous run of 'out'
+    frame_count, n_fft = frames.shape
+    for b in range(-(-n_fft//hop)):
+        block = frames[:, b*hop:(b+1)*hop]
+        block = torch.nn.functional.pad(block, (0, hop-block.shape[1])).reshape(-1)
+        start = b*hop - offset
+        lo, hi = max(start, 0), min(start + frame_count*hop, out.shape[0])
+        if hi > lo:
+            out[lo:hi] += block[lo-start:hi-start]
+
+
+
+
+
+class StreamingPreProcessing(torch.nn.Module):
+    """
+    Frame-by-frame counterpart of PreProcessing. Samples are fed in arbitrary-sized
+    chunks and each call returns the spectrogram frames completed by that chunk,
+    shape (frames, output_size). The stream is taken to start in silence, so half a
+    frame of zeros replaces the centered padding of the first frame; all later
+    frames equal those of PreProcessing. Resampling is not streamed, so the input
+    and resampling rates must match.
+    """
+
+    def __init__(self, preprocessor: PreProcessing):
+        super().__init__()
+        assert preprocessor.resample.orig_freq == preprocessor.resample.new_freq, \
+            "Streaming requires matching input and resampling rates"
+        self.n_fft = preprocessor.spec.n_fft
+        self.hop_length = preprocessor.spec.hop_length
+        self.window = preprocessor.spec.window
+        self.output_size = preprocessor.output_size
+        self.reset()
+
+    def reset(self):
+        self.buffer = torch.zeros(self.n_fft//2, device=self.window.device)
+
+    def forward(self, chunk: torch.Tensor) -> torch.Tensor:
+        data = torch.cat((self.buffer, chunk.to(self.buffer)))
+        frame_count = max(0, (data.shape[-1]-self.n_fft)//self.hop_length + 1)
+
+        # keep the samples from the first incomplete frame onwards
+        self.buffer = data[frame_count*self.hop_length:]
+        if frame_count == 0:
+            return torch.zeros((0, self.output_size), dtype=torch.complex64, device=data.device)
+
+        frames = data.unfold(-1, self.n_fft, self.hop_length)[:frame_count]
+        return torch.fft.rfft(frames*self.window, dim=-1)
+
+
+
+class StreamingPostProcessing(torch.nn.Module):
+    """
+    Frame-by-frame counterpart of PostProcessing. Each spectrogram frame returns the
+    hop_length samples that no later frame can change, normalized by the overlap-added
+    squared window as in the inverse spectrogram. The samples that PostProcessing trims
+    as centered padding are dropped, so the first frame returns nothing; flush() is not
+    needed here, as StreamingPreProcessing pads the end of the stream.
+    """
+
+    def __init__(self, postprocessor: PostProcessing):
+        super().__init__()
+        assert postprocessor.resample.orig_freq == postprocessor.resample.new_freq, \
+            "Streaming requires matching resampling and output rates"
+        self.n_fft = postprocessor.invspec.n_fft
+        self.hop_length = postprocessor.invspec.hop_length
+        self.window = postprocessor.invspec.window
+        self.reset()
+
+    def reset(self):
+        # overlap-add and window envelope of the samples not yet returned
+        self.signal = torch.zeros(self.n_fft, device=self.window.device)
+        self.envelope = torch.zeros(self.n_fft, device=self.window.device)
+        self.skip = self.n_fft//2
+
+    def forward(self, spec: torch.Tensor) -> torch.Tensor:
+        output = []
+        spec = spec.to(self.window.device)
+        frames = torch.fft.irfft(spec, n=self.n_fft, dim=-1) * self.window if spec.shape[0] else ()
+        for frame in frames:
+            self.signal = self.signal + frame
+            self.envelope = self.envelope + self.window**2
+            output.append(self.signal[:self.hop_length] / self.envelope[:self.hop_length].clamp_min(1e-11))
+            self.signal = torch.nn.functional.pad(self.signal[self.hop_length:], (0, self.hop_length))
+            self.envelope = torch.nn.functional.pad(self.envelope[self.hop_length:], (0, self.hop_length))
 
+        output = torch.cat(output) if output else self.signal[:0]
+        skip = min(self.skip, output.shape[-1])
+        self.skip -= skip
+        return output[skip:]
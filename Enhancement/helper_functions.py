@@ -1,71 +1,58 @@
 # Initialization
-import matplotlib.pyplot as plt
-from scipy.io import wavfile
-import scipy
-import scipy.fft
+import importlib
 import numpy as np
+import os
+import sys
 
+# the framing engine is shared with the Representations chapter
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','Representations'))
+import framing
+from framing import window_lengths, hann_window, frame_signal, overlap_add, window_sum, window_sum_blocks
+from framing import frame_stft, frame_istft, frame_zcr, frame_energy
 
-def stft(data,fs,window_length_ms=30,window_step_ms=20,windowing_function=None):
-    window_length = int(window_length_ms*fs/2000)*2
-    window_step = int(window_step_ms*fs/1000)
-    if windowing_function is None:
-        windowing_function = np.sin(np.pi*np.arange(0.5,window_length,1)/window_length)**2
-    
-    total_length = len(data)
-    window_count = int( (total_length-window_length)/window_step) + 1
-    
-    spectrum_length = int((window_length)/2)+1
-    spectrogram = np.zeros((window_count,spectrum_length),dtype=complex)
 
-    for k in range(window_count):
-        starting_position = k*window_step
+# plotting and file I/O modules are imported on first access, e.g. helper_functions.plt,
+# so that importing the DSP functions does not load matplotlib or scipy
+_LAZY_MODULES = {'plt': 'matplotlib.pyplot', 'wavfile': 'scipy.io.wavfile', 'scipy': 'scipy'}
 
-        data_vector = data[starting_position:(starting_position+window_length),]
-        window_spectrum = scipy.fft.rfft(data_vector*windowing_function,n=window_length)
+def __getattr__(name):
+    if name not in _LAZY_MODULES:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    module = importlib.import_module(_LAZY_MODULES[name])
+    globals()[name] = module
+    return module
 
-        spectrogram[k,:] = window_spectrum
-        
-    return spectrogram
 
-def istft(spectrogram,fs,window_length_ms=30,window_step_ms=20,windowing_function=None):
-    window_length = int(window_length_ms*fs/2000)*2
-    window_step = int(window_step_ms*fs/1000)
-    #if windowing_function is None:
-    #    windowing_function = np.ones(window_length)
-    window_count = spectrogram.shape[0]
-    
-    total_length = (window_count-1)*window_step + window_length
-    data = np.zeros(total_length)
-    
-    for k in range(window_count):
-        starting_position = k*window_step
-        ix = np.arange(starting_position,starting_position+window_length)
+# float32 data and complex64 spectrograms are transformed in single precision, unless
+# dtype (float32/complex64 or float64/complex128) sets the precision explicitly
+def stft(data,fs,window_length_ms=30,window_step_ms=20,windowing_function=None,workers=None,dtype=None):
+    window_length, window_step = window_lengths(fs,window_length_ms,window_step_ms,even_length=True)
+    return frame_stft(data,window_length,window_step,windowing_function,workers,dtype)
 
-        thiswin = scipy.fft.irfft(spectrogram[k,:],n=window_length)
-        data[ix] = data[ix] + thiswin*windowing_function
-        
-    return data
+def istft(spectrogram,fs,window_length_ms=30,window_step_ms=20,windowing_function=None,normalize=True,workers=None,dtype=None):
+    window_length, window_step = window_lengths(fs,window_length_ms,window_step_ms,even_length=True)
+    return frame_istft(spectrogram,window_length,window_step,windowing_function,normalize,workers,dtype)
+
+
+class StreamingSTFT(framing.StreamingSTFT):
+    # chunked counterpart of stft(), with its even window length
+    def __init__(self,fs,window_length_ms=30,window_step_ms=20,windowing_function=None,workers=None,dtype=None):
+        super().__init__(fs,window_length_ms,window_step_ms,windowing_function,True,workers,dtype)
+
+
+class StreamingISTFT(framing.StreamingISTFT):
+    # chunked counterpart of istft(), with its even window length
+    def __init__(self,fs,window_length_ms=30,window_step_ms=20,windowing_function=None,normalize=True,workers=None,dtype=None):
+        super().__init__(fs,window_length_ms,window_step_ms,windowing_function,normalize,True,workers,dtype)
 
 
 def halfsinewindow(window_length):
     return np.sin(np.pi*np.arange(0.5,window_length,1)/window_length)
 
 def zcr(data,fs,window_length_ms=30,window_step_ms=20):
-    window_length = int(window_length_ms*fs/1000)
-    window_step = int(window_step_ms*fs/1000)
-    windowing_function = np.sin(np.pi*np.arange(0.5,window_length,1)/window_length)**2
-    
-    total_length = len(data)
-    window_count = int( (total_length-window_length)/window_step) + 1
-
-    y = np.zeros(window_count)
-
-    for k in range(window_count):
-        starting_position = k*window_step
+    window_length, window_step = window_lengths(fs,window_length_ms,window_step_ms)
+    return frame_zcr(data,window_length,window_step)
 
-        data_vector = data[starting_position:(starting_position+window_length),]
-        y[k] = np.sum(np.abs(np.diff(np.sign(data_vector))))
-        
-    return y
-    
\ No newline at end of file
+def energy(data,fs,window_length_ms=30,window_step_ms=20):
+    window_length, window_step = window_lengths(fs,window_length_ms,window_step_ms)
+    return frame_energy(data,window_length,window_step)
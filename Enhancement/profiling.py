@@ -0,0 +1,144 @@
+import csv
+import json
+import time
+import torch
+from torch.nn.utils.rnn import PackedSequence
+
+
+REPORT_FIELDS = ('model', 'stage', 'calls', 'seconds', 'output_bytes', 'frames', 'rtf')
+
+
+def _tensors(value):
+    if isinstance(value, torch.Tensor):
+        return [value]
+    if isinstance(value, PackedSequence):
+        return [value.data]
+    if isinstance(value, (tuple, list)):
+        return [tensor for item in value for tensor in _tensors(item)]
+    return []
+
+def _frame_rows(value):
+    # frames in a frame-major tensor of shape (frames, [batch,] features) or a packed sequence
+    if isinstance(value, (tuple, list)):
+        value = value[0]
+    if isinstance(value, PackedSequence):
+        return value.data.shape[0]
+    return value.numel()//value.shape[-1] if value.dim() else 0
+
+
+class StageProfiler:
+    """
+    Opt-in per-stage instrumentation of an enhancer. Within the context, forward
+    hooks on the frontend transforms, the GRUs, the dense gain layer and the
+    enhancer itself record calls, wall time, bytes of the output tensors and
+    spectrogram frames processed per stage, and mark each stage as a
+    torch.profiler range. The hooks exist only inside the context, so a model
+    that is not being profiled runs unchanged.
+
+        with StageProfiler(enhancer) as profiler:
+            enhancer(waveform)
+        profiler.to_csv('profile.csv')
+
+    The real-time factor of 'forward' is its time over the duration of its input
+    audio; forward_batch() has no 'forward' row, but its stages are recorded.
+    With 'synchronize', accelerator work is awaited at each stage boundary.
+    """
+
+    def __init__(self, enhancer, synchronize=False):
+        self.enhancer = enhancer
+        self.synchronize = synchronize
+        self.samplerate = enhancer.preprocessor.resample.orig_freq
+
+        # stage name, module and the number of frames of one call from (inputs, output)
+        self.stages = [
+            ('forward', enhancer, lambda inputs, output: 0),
+            ('resample_in', enhancer.preprocessor.resample, lambda inputs, output: 0),
+            ('stft', enhancer.preprocessor.spec, lambda inputs, output: output.shape[-1]),
+        ] + [
+            (name, getattr(enhancer, name), lambda inputs, output: _frame_rows(output[0]))
+            for name in enhancer.recurrent_modules
+        ] + [
+            ('dense_output', enhancer.dense_output, lambda inputs, output: _frame_rows(output)),
+            ('istft', enhancer.postprocessor.invspec, lambda inputs, output: inputs[0].shape[-1]),
+            ('resample_out', enhancer.postprocessor.resample, lambda inputs, output: 0),
+        ]
+        self.reset()
+        self.handles = []
+
+    def reset(self):
+        self.records = {name: dict(calls=0, seconds=0., output_bytes=0, frames=0) for name, _, _ in self.stages}
+        self.audio_seconds = 0.
+
+    def _sync(self):
+        if self.synchronize and torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+    def _hooks(self, name, count_frames):
+        started = []
+
+        def pre_hook(module, inputs):
+            if name == 'forward':
+                self.audio_seconds += inputs[0].shape[-1]/self.samplerate
+            self._sync()
+            ranges = torch.autograd.profiler.record_function('enhancer.' + name)
+            ranges.__enter__()
+            started.append((ranges, time.perf_counter()))
+
+        def post_hook(module, inputs, output):
+            self._sync()
+            ranges, start = started.pop()
+            elapsed = time.perf_counter() - start
+            ranges.__exit__(None, None, None)
+            record = self.records[name]
+            record['calls'] += 1
+            record['seconds'] += elapsed
+            record['output_bytes'] += sum(tensor.nbytes for tensor in _tensors(output))
+            record['frames'] += count_frames(inputs, output)
+
+        return pre_hook, post_hook
+
+    def __enter__(self):
+        for name, module, count_frames in self.stages:
+            pre_hook, post_hook = self._hooks(name, count_frames)
+            self.handles.append(module.register_forward_pre_hook(pre_hook))
+            self.handles.append(module.register_forward_hook(post_hook))
+        return self
+
+    def __exit__(self, *exc_info):
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+
+    def report(self):
+        # one row per stage; the real-time factor of each stage is relative to the forward() audio
+        model = type(self.enhancer).__name__
+        return [
+            dict(model=model, stage=name, **record,
+                 rtf=record['seconds']/self.audio_seconds if self.audio_seconds else 0.)
+            for name, record in self.records.items()
+        ]
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'audio_seconds': self.audio_seconds, 'stages': self.report()}, f, indent=1)
+
+    def to_csv(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.report())
+
+
+def profile_trace(enhancer, waveform, path, repeats=1):
+    # torch.profiler trace of enhancer(waveform), with the stages as named ranges, in Chrome
+    # trace format; returns the StageProfiler of the same calls
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    with StageProfiler(enhancer, synchronize=True) as profiler:
+        with torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True) as trace:
+            with torch.inference_mode():
+                for _ in range(repeats):
+                    enhancer(waveform)
+    trace.export_chrome_trace(path)
+    return profiler
@@ -0,0 +1,92 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import torch
+from torch.ao.quantization import quantize_dynamic
+import Enhancer
+from audio_io import read_wav, wav_chunks
+
+
+QUANTIZED_DTYPES = {'int8': torch.qint8, 'float16': torch.float16}
+SOUNDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sounds')
+
+
+def quantize_enhancer(enhancer, dtype='int8'):
+    # dynamically quantized copy: GRU and Linear weights are stored in int8 (or float16) and
+    # activations are quantized on the fly, while the frontend stays in float32
+    assert dtype in QUANTIZED_DTYPES, "Unknown dtype {}, use one of {}".format(dtype, sorted(QUANTIZED_DTYPES))
+    assert torch.device(enhancer.device).type == 'cpu', "Dynamic quantization runs on the CPU only"
+    return quantize_dynamic(enhancer, {torch.nn.GRU, torch.nn.Linear}, dtype=QUANTIZED_DTYPES[dtype]).eval()
+
+
+def load_quantized_enhancer(enhancer_class, checkpoint, dtype='int8', **kwargs):
+    return quantize_enhancer(Enhancer.load_enhancer(enhancer_class, checkpoint, **kwargs), dtype)
+
+
+def read_waveform(filename):
+    # mono float32 waveform in [-1, 1) and its sampling rate
+    fs, data = read_wav(filename)
+    return torch.cat(list(wav_chunks(data, max(1, data.shape[0])))), fs
+
+
+def snr_deviation_db(reference, estimate):
+    # SNR of the estimate, taking the deviation from the reference as noise
+    error = torch.sum((reference - estimate)**2)
+    return float(10*torch.log10(torch.sum(reference**2) / torch.clamp(error, min=1e-20)))
+
+
+def verify_quantization(enhancer_class, checkpoint=None, files=None, dtype='int8', **kwargs):
+    """
+    Compare a quantized enhancer to its float model on WAV files, by default
+    Enhancement/sounds/*.wav. Each file is enhanced by both models at its own
+    sampling rate. Returns one dict per file with the SNR of the quantized output
+    against the float output, in dB, and the real-time factors of both models.
+    Without a checkpoint, freshly initialized weights are used.
+    """
+    if files is None:
+        files = sorted(glob.glob(os.path.join(SOUNDS, '*.wav')))
+
+    results = []
+    for filename in files:
+        waveform, fs = read_waveform(filename)
+        if checkpoint is None:
+            enhancer = enhancer_class(input_samplerate=fs, **kwargs).eval()
+        else:
+            enhancer = Enhancer.load_enhancer(enhancer_class, checkpoint, input_samplerate=fs, **kwargs)
+        quantized = quantize_enhancer(enhancer, dtype)
+
+        with torch.inference_mode():
+            start = time.perf_counter()
+            reference = enhancer(waveform)
+            float_time = time.perf_counter() - start
+            start = time.perf_counter()
+            estimate = quantized(waveform)
+            quantized_time = time.perf_counter() - start
+
+        duration = len(waveform)/fs
+        results.append({
+            'file': os.path.basename(filename),
+            'samplerate': fs,
+            'snr_db': snr_deviation_db(reference, estimate),
+            'float_rtf': float_time/duration,
+            'quantized_rtf': quantized_time/duration,
+        })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Verify a dynamically quantized enhancer against its float model.')
+    parser.add_argument('model', choices=['SimpleEnhancer', 'NoiseModelEnhancer', 'VADNoiseModelEnhancer'])
+    parser.add_argument('checkpoint', nargs='?', help='trained weights; freshly initialized weights if omitted')
+    parser.add_argument('--dtype', choices=sorted(QUANTIZED_DTYPES), default='int8')
+    parser.add_argument('--files', nargs='+', help='WAV files, by default sounds/*.wav')
+    parser.add_argument('--min-snr-db', type=float, default=20., help='fail if any file falls below this SNR')
+    args = parser.parse_args()
+
+    results = verify_quantization(getattr(Enhancer, args.model), args.checkpoint, args.files, args.dtype)
+    print('{:<28}{:>8}{:>10}{:>12}{:>14}'.format('file', 'fs', 'SNR dB', 'float RTF', args.dtype + ' RTF'))
+    for result in results:
+        print('{file:<28}{samplerate:>8}{snr_db:>10.1f}{float_rtf:>12.4f}{quantized_rtf:>14.4f}'.format(**result))
+    sys.exit(0 if all(result['snr_db'] >= args.min_snr_db for result in results) else 1)
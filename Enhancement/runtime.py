@@ -0,0 +1,37 @@
+# Inference runners for enhancers exported with export.py. Only torch (or
+# onnxruntime) is imported, not Enhancer.py, frontend.py or torchaudio.
+import torch
+
+
+class TorchScriptRunner:
+    """
+    Runs an exported TorchScript enhancer on 1-D float32 waveforms under
+    torch.inference_mode with a fixed number of intra-op threads.
+    """
+
+    def __init__(self, path, threads=1):
+        torch.set_num_threads(threads)
+        self.module = torch.jit.load(path, map_location='cpu').eval()
+
+    def __call__(self, waveform):
+        with torch.inference_mode():
+            return self.module(torch.as_tensor(waveform, dtype=torch.float32))
+
+
+class OnnxRunner:
+    """
+    Runs an exported ONNX enhancer with onnxruntime, which is only needed here,
+    with a fixed number of intra-op threads. Takes and returns numpy arrays.
+    """
+
+    def __init__(self, path, threads=1):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, waveform):
+        waveform = torch.as_tensor(waveform, dtype=torch.float32).numpy()
+        return self.session.run(None, {self.input_name: waveform})[0]
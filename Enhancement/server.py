@@ -0,0 +1,172 @@
+import asyncio
+import collections
+import concurrent.futures
+import time
+import numpy as np
+import torch
+
+
+class ServerMetrics:
+    """
+    Counters of an EnhancerServer: batch-size histogram and request latencies,
+    from submission to result, over the last 'window' requests.
+    """
+
+    def __init__(self, window=10000):
+        self.batch_sizes = collections.Counter()
+        self.latencies = collections.deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+
+    def record_batch(self, latencies, failures=0):
+        self.batch_sizes[len(latencies)] += 1
+        self.latencies.extend(latencies)
+        self.requests += len(latencies)
+        self.failures += failures
+
+    def snapshot(self, queue_depth=0):
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {
+            'queue_depth': queue_depth,
+            'requests': self.requests,
+            'failures': self.failures,
+            'batches': sum(self.batch_sizes.values()),
+            'batch_size_histogram': dict(sorted(self.batch_sizes.items())),
+            'latency_p50_ms': float(np.percentile(latencies, 50))*1000,
+            'latency_p99_ms': float(np.percentile(latencies, 99))*1000,
+        }
+
+
+class EnhancerServer:
+    """
+    Asyncio micro-batching front end of an enhancer. Callers await enhance() with
+    a 1-D waveform at the enhancer's input rate. Queued waveforms are collected
+    into a batch until 'max_batch_size' are waiting or 'max_wait_ms' have passed
+    since the first one, and the batch is enhanced with forward_batch(), one
+    packed GRU pass, on a single inference thread, so the event loop keeps
+    accepting requests meanwhile. When the server stops, or its serving loop fails,
+    every queued or in-flight request fails with a RuntimeError, and later calls
+    to enhance() are rejected.
+
+        async with EnhancerServer(enhancer, max_batch_size=16, max_wait_ms=5) as server:
+            enhanced = await server.enhance(waveform)
+            print(server.metrics())
+    """
+
+    def __init__(self, enhancer, max_batch_size=16, max_wait_ms=5.):
+        self.enhancer = enhancer.eval()
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms/1000
+        self.stats = ServerMetrics()
+        self.queue = None
+        self.task = None
+        self.executor = None
+        self.running = False
+        self.pending = set()
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.running = True
+        self.task = asyncio.create_task(self._serve())
+
+    async def stop(self):
+        self.running = False
+        self.task.cancel()
+        try:
+            await self.task
+        except (asyncio.CancelledError, Exception):
+            # a failure of the serving loop has already been passed to the requests
+            pass
+        self._fail_pending(RuntimeError('EnhancerServer was stopped'))
+        # wait for an in-flight batch without blocking the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def enhance(self, waveform: torch.Tensor) -> torch.Tensor:
+        if not self.running:
+            raise RuntimeError('EnhancerServer is not running')
+        future = asyncio.get_running_loop().create_future()
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        await self.queue.put((waveform, future, time.perf_counter()))
+        return await future
+
+    def metrics(self):
+        return self.stats.snapshot(self.queue.qsize() if self.queue is not None else 0)
+
+    def _enhance_batch(self, waveforms):
+        # results, or the exceptions of the waveforms that failed; a failing batch is retried
+        # one waveform at a time, so that one bad request does not fail the others
+        with torch.inference_mode():
+            try:
+                return self.enhancer.forward_batch(waveforms)
+            except Exception as error:
+                if len(waveforms) == 1:
+                    return [error]
+            outputs = []
+            for waveform in waveforms:
+                try:
+                    outputs.append(self.enhancer(waveform))
+                except Exception as error:
+                    outputs.append(error)
+            return outputs
+
+    def _fail_pending(self, error):
+        # fail the queued requests and those of the batch in flight
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        for future in list(self.pending):
+            if not future.done():
+                future.set_exception(error)
+
+    async def _serve(self):
+        try:
+            await self._serve_batches()
+        except asyncio.CancelledError:
+            self._fail_pending(RuntimeError('EnhancerServer was stopped'))
+            raise
+        except BaseException as error:
+            self.running = False
+            failure = RuntimeError('EnhancerServer failed: {!r}'.format(error))
+            failure.__cause__ = error
+            self._fail_pending(failure)
+            raise
+
+    async def _serve_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # callers that gave up while queued are dropped
+            batch = [item for item in batch if not item[1].cancelled()]
+            if not batch:
+                continue
+            outputs = await loop.run_in_executor(self.executor, self._enhance_batch, [item[0] for item in batch])
+
+            done = time.perf_counter()
+            self.stats.record_batch(
+                [done - submitted for _, _, submitted in batch],
+                sum(isinstance(output, Exception) for output in outputs))
+            for (_, future, _), output in zip(batch, outputs):
+                if future.done():
+                    continue
+                if isinstance(output, Exception):
+                    future.set_exception(output)
+                else:
+                    future.set_result(output)
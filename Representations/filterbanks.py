@@ -0,0 +1,132 @@
+import functools
+import numpy as np
+
+from precision import float_dtypes
+
+
+def freq2mel(f): return 2595*np.log10(1 + (f/700))
+def mel2freq(m): return 700*(10**(m/2595) - 1)
+
+
+class Filterbank:
+    """
+    Triangular filterbank with read-only dense and sparse (CSR) forms.
+
+    apply() maps spectra of shape (..., speclen), or (speclen, frames) with
+    axis=0, to band energies and reconstruct_spectrum() maps band energies back
+    to spectra. 'filterbank' and 'reconstruct' are the dense
+    (speclen, bands) and (bands, speclen) matrices returned by melfilterbank()
+    and linearfilterbank(). Both methods compute in the precision of their
+    input, float32 for float32 spectra, unless 'dtype' is given. The sparse
+    forms 'filters' and 'reconstruct_filters', and scipy.sparse, are only
+    built when first used.
+    """
+
+    def __init__(self, filterbank):
+        self.speclen, self.bands = filterbank.shape
+
+        # reconstruction filters scale each filter by its inverse energy
+        norm = np.sum(filterbank**2+1e-12,axis=0)**-1
+        reconstruct = filterbank.T*norm[:,None]
+
+        self.filterbank = filterbank
+        self.reconstruct = reconstruct
+        self.filterbank.flags.writeable = False
+        self.reconstruct.flags.writeable = False
+        self.converted = {}
+
+    @functools.cached_property
+    def filters(self):
+        import scipy.sparse
+        return scipy.sparse.csr_array(self.filterbank.T)
+
+    @functools.cached_property
+    def reconstruct_filters(self):
+        import scipy.sparse
+        return scipy.sparse.csr_array(self.reconstruct.T)
+
+    def astype(self, dtype):
+        # Filterbank with all matrices in 'dtype', converted once and shared
+        dtype = np.dtype(dtype)
+        if dtype == self.filterbank.dtype:
+            return self
+        if dtype not in self.converted:
+            converted = Filterbank.__new__(Filterbank)
+            converted.speclen, converted.bands = self.speclen, self.bands
+            converted.filterbank = self.filterbank.astype(dtype)
+            converted.reconstruct = self.reconstruct.astype(dtype)
+            converted.filterbank.flags.writeable = False
+            converted.reconstruct.flags.writeable = False
+            converted.converted = {}
+            self.converted[dtype] = converted
+        return self.converted[dtype]
+
+    def _operands(self, values, dtype):
+        real, complex_ = float_dtypes(values, dtype)
+        values = np.asarray(values, dtype=complex_ if np.iscomplexobj(values) else real)
+        return self.astype(real), values
+
+    def apply(self, spectrum, axis=-1, dtype=None):
+        # with frequency on the first axis, as in librosa spectrograms, the CSR product only
+        # reads the non-zero coefficients; with frequency last, each spectrum row is read once
+        # by a dense BLAS product, which is faster there than the strided sparse product
+        filters, spectrum = self._operands(spectrum, dtype)
+        if axis == 0:
+            return filters.filters @ spectrum
+        return np.matmul(spectrum,filters.filterbank)
+
+    def reconstruct_spectrum(self, bands, axis=-1, dtype=None):
+        filters, bands = self._operands(bands, dtype)
+        if axis == 0:
+            return filters.reconstruct_filters @ bands
+        return np.matmul(bands,filters.reconstruct)
+
+
+def triangular_filterbank(freqvec, freq_idx, filter_count, bands):
+    # filter k rises from freq_idx[k] to freq_idx[k+1] and falls to freq_idx[k+2];
+    # the first filter is flat below its peak and the last one flat above it
+    filterbank = np.zeros((len(freqvec),bands))
+    if filter_count < 1:
+        return filterbank
+    k = np.arange(filter_count)
+    upslope = np.ones((len(freqvec),filter_count))
+    downslope = np.ones((len(freqvec),filter_count))
+    upslope[:,1:] = (freqvec[:,None]-freq_idx[k[1:]])/(freq_idx[k[1:]+1]-freq_idx[k[1:]])
+    downslope[:,:-1] = 1 - (freqvec[:,None]-freq_idx[k[:-1]+1])/(freq_idx[k[:-1]+2]-freq_idx[k[:-1]+1])
+    filterbank[:,:filter_count] = np.maximum(0,np.minimum(upslope,downslope))
+    return filterbank
+
+
+@functools.lru_cache(maxsize=32)
+def _melfilters(speclen, maxfreq, melbands):
+    maxmel = freq2mel(maxfreq)
+    mel_idx = np.array(np.arange(.5,melbands,1)/melbands)*maxmel
+    freq_idx = mel2freq(mel_idx)
+
+    freqvec = np.arange(0,speclen,1)*maxfreq/speclen
+    return Filterbank(triangular_filterbank(freqvec,freq_idx,melbands-2,melbands))
+
+def melfilters(speclen, maxfreq, melbands = 20):
+    # cached Filterbank, shared by all callers with the same (speclen, maxfreq, melbands)
+    return _melfilters(speclen, maxfreq, melbands)
+
+def melfilterbank(speclen, maxfreq, melbands = 20, dtype=np.float64):
+    filters = melfilters(speclen, maxfreq, melbands).astype(dtype)
+    return filters.filterbank, filters.reconstruct
+
+
+@functools.lru_cache(maxsize=32)
+def _linearfilters(speclen, maxfreq_Hz, bandwidth_Hz):
+    bandstep_Hz = bandwidth_Hz/2
+    bands = int(maxfreq_Hz/bandstep_Hz)+1
+    freqvec = np.arange(0,speclen,1)*maxfreq_Hz/speclen
+    freq_idx = np.arange(-bandstep_Hz/2,maxfreq_Hz+bandstep_Hz/2,bandstep_Hz)
+    return Filterbank(triangular_filterbank(freqvec,freq_idx,bands-1,bands))
+
+def linearfilters(speclen, maxfreq_Hz, bandwidth_Hz=500):
+    # cached Filterbank, shared by all callers with the same (speclen, maxfreq_Hz, bandwidth_Hz)
+    return _linearfilters(speclen, maxfreq_Hz, bandwidth_Hz)
+
+def linearfilterbank(speclen, maxfreq_Hz, bandwidth_Hz=500, dtype=np.float64):
+    filters = linearfilters(speclen, maxfreq_Hz, bandwidth_Hz).astype(dtype)
+    return filters.filterbank, filters.reconstruct
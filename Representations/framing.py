@@ -0,0 +1,307 @@
+# Shared short-time framing engine for the helper_functions.py modules of the
+# Representations and Enhancement chapters. Window lengths and steps are given
+# in samples here; the helper functions convert from milliseconds. float32 input is
+# framed and transformed in single precision (complex64 spectra) unless dtype= overrides.
+# scipy.fft is imported on the first transform, so importing the engine stays cheap.
+import functools
+import numpy as np
+
+from filterbanks import melfilters
+from precision import float_dtypes
+
+
+def window_lengths(fs,window_length_ms,window_step_ms,even_length=False):
+    # Enhancement rounds the window length down to an even number of samples
+    if even_length:
+        window_length = int(window_length_ms*fs/2000)*2
+    else:
+        window_length = int(window_length_ms*fs/1000)
+    window_step = int(window_step_ms*fs/1000)
+    return window_length, window_step
+
+def hann_window(window_length):
+    return np.sin(np.pi*np.arange(0.5,window_length,1)/window_length)**2
+
+
+def frame_signal(data,window_length,window_step):
+    # zero-copy strided view of all complete frames, shape (..., window_count, window_length);
+    # a signal shorter than one window has no frames
+    data = np.asarray(data)
+    if data.shape[-1] < window_length:
+        return np.zeros(data.shape[:-1] + (0,window_length),dtype=data.dtype)
+    frames = np.lib.stride_tricks.sliding_window_view(data,window_length,axis=-1)
+    return frames[...,::window_step,:]
+
+def overlap_add(frames,window_step):
+    # sum (..., window_count, window_length) frames at hop window_step, one hop-sized block
+    # offset at a time, so the loop runs over ceil(window_length/window_step) blocks, not frames
+    window_count, window_length = frames.shape[-2:]
+    block_count = -(-window_length//window_step)
+    total_length = (window_count-1)*window_step + window_length if window_count else 0
+
+    data = np.zeros(frames.shape[:-2] + (window_count+block_count-1,window_step),dtype=frames.dtype)
+    for b in range(block_count):
+        block = frames[...,b*window_step:(b+1)*window_step]
+        data[...,b:b+window_count,:block.shape[-1]] += block
+
+    return data.reshape(frames.shape[:-2] + (-1,))[...,:total_length]
+
+
+@functools.lru_cache(maxsize=32)
+def _window_sum_cumulative(window_bytes,window_step):
+    # forward and backward cumulative sums of the hop-sized blocks of the squared window,
+    # each of shape (block_count+1, window_step)
+    window = np.frombuffer(window_bytes)
+    block_count = -(-len(window)//window_step)
+    blocks = np.zeros((block_count,window_step))
+    blocks.reshape(-1)[:len(window)] = window**2
+    prefix = np.zeros((block_count+1,window_step))
+    suffix = np.zeros((block_count+1,window_step))
+    np.cumsum(blocks,axis=0,out=prefix[1:])
+    np.cumsum(blocks[::-1],axis=0,out=suffix[-2::-1])
+    return prefix, suffix
+
+def window_sum_blocks(windowing_function,window_step,window_count,j):
+    # overlap-added squared window of window_count frames at output blocks j, shape (len(j), window_step)
+    window = np.ascontiguousarray(windowing_function,dtype=float)
+    prefix, suffix = _window_sum_cumulative(window.tobytes(),window_step)
+    block_count = prefix.shape[0]-1
+
+    # output block j receives window blocks lower ... upper-1; whole heads and tails are
+    # read directly from the cumulative sums to keep the small edge values accurate
+    upper = np.minimum(j,block_count-1) + 1
+    lower = np.maximum(j-window_count+1,0)
+    return np.where((lower==0)[:,None],prefix[upper],
+                    np.where((upper==block_count)[:,None],suffix[lower],prefix[upper]-prefix[lower]))
+
+def window_sum_floor(windowing_function,window_step):
+    # samples whose overlap-added squared window is below 1e-3 of its steady-state maximum are
+    # left unscaled by the normalization, since dividing by it would amplify the edges of any
+    # spectrogram that is not an exact STFT; the threshold only depends on window and hop, so
+    # streaming and whole-signal inverses agree
+    window = np.ascontiguousarray(windowing_function,dtype=float)
+    prefix, _ = _window_sum_cumulative(window.tobytes(),window_step)
+    return 1e-3*np.max(prefix[-1])
+
+def normalize_window_sum(data,norm,floor):
+    # divide the overlap-added frames by the squared window sum where it exceeds floor
+    data /= np.where(norm > floor,norm,1.)
+    return data
+
+def window_sum(windowing_function,window_step,window_count):
+    # overlap-added squared window of window_count frames, for weighted overlap-add normalization
+    window_length = len(windowing_function)
+    block_count = -(-window_length//window_step)
+    total_length = (window_count-1)*window_step + window_length if window_count else 0
+
+    j = np.arange(window_count+block_count-1)
+    return window_sum_blocks(windowing_function,window_step,window_count,j).reshape(-1)[:total_length]
+
+
+def frame_stft(data,window_length,window_step,windowing_function=None,workers=None,dtype=None):
+    import scipy.fft
+    if windowing_function is None:
+        windowing_function = hann_window(window_length)
+    real, _ = float_dtypes(data,dtype)
+    data = np.asarray(data,dtype=real)
+
+    # window all frames with one broadcast multiply and transform them in one batch
+    frames = frame_signal(data,window_length,window_step)
+    return scipy.fft.rfft(frames*np.asarray(windowing_function,dtype=real),n=window_length,axis=-1,workers=workers)
+
+def frame_istft(spectrogram,window_length,window_step,windowing_function=None,normalize=True,workers=None,dtype=None):
+    import scipy.fft
+    if windowing_function is None:
+        windowing_function = hann_window(window_length)
+    real, complex_ = float_dtypes(spectrogram,dtype)
+    spectrogram = np.asarray(spectrogram,dtype=complex_)
+    window_count = spectrogram.shape[-2]
+
+    frames = scipy.fft.irfft(spectrogram,n=window_length,axis=-1,workers=workers)
+    data = overlap_add(frames*np.asarray(windowing_function,dtype=real),window_step)
+
+    # divide by the overlap-added squared window for perfect reconstruction of frame_stft output
+    if normalize:
+        normalize_window_sum(data,window_sum(windowing_function,window_step,window_count),
+                             window_sum_floor(windowing_function,window_step))
+
+    return data
+
+def _frame_sums(cumulative,window_length,window_step,window_count):
+    # per-frame sums from a cumulative sum with a leading zero, via two strided slices
+    if window_count == 0:
+        return cumulative[...,:0]
+    end = (window_count-1)*window_step
+    return cumulative[...,window_length:window_length+end+1:window_step] - cumulative[...,:end+1:window_step]
+
+def frame_zcr(data,window_length,window_step):
+    # sign changes are computed once over the whole signal and summed per frame from their
+    # cumulative sum, which is exact in integers, so the cost is O(samples) for any overlap
+    data = np.asarray(data)
+    window_count = max(0,(data.shape[-1]-window_length)//window_step + 1)
+    crossings = np.abs(np.diff(np.sign(data),axis=-1))
+    cumulative = np.zeros(crossings.shape[:-1] + (crossings.shape[-1]+1,),dtype=np.int64)
+    np.cumsum(crossings,axis=-1,out=cumulative[...,1:])
+    return _frame_sums(cumulative,window_length-1,window_step,window_count).astype(float_dtypes(data)[0])
+
+def frame_energy(data,window_length,window_step):
+    # integer samples are summed exactly from a cumulative sum of squares; float samples are
+    # reduced over the strided frame view, as a float cumulative sum would lose quiet frames
+    data = np.asarray(data)
+    window_count = max(0,(data.shape[-1]-window_length)//window_step + 1)
+    if np.issubdtype(data.dtype,np.integer):
+        cumulative = np.zeros(data.shape[:-1] + (data.shape[-1]+1,),dtype=np.int64)
+        np.cumsum(np.square(data,dtype=np.int64),axis=-1,out=cumulative[...,1:])
+        return _frame_sums(cumulative,window_length,window_step,window_count).astype(float)
+    frames = frame_signal(data,window_length,window_step)
+    return np.einsum('...i,...i->...',frames,frames)
+
+
+class StreamingSTFT:
+    """
+    Chunked counterpart of frame_stft(). Samples are fed in arbitrary-sized chunks
+    and each call to process() returns the frames completed by that chunk, shape
+    (..., frames, window_length//2+1). Only the partial frame is kept between
+    calls, and the concatenated output equals frame_stft() of the concatenated
+    input. Window lengths are rounded as in window_lengths(), so even_length=True
+    matches the stft() of the Enhancement chapter.
+    """
+
+    def __init__(self,fs,window_length_ms=30,window_step_ms=20,windowing_function=None,even_length=False,workers=None,dtype=None):
+        self.window_length, self.window_step = window_lengths(fs,window_length_ms,window_step_ms,even_length)
+        if windowing_function is None:
+            windowing_function = hann_window(self.window_length)
+        self.windowing_function = windowing_function
+        self.workers = workers
+        self.dtype = dtype
+        self.buffer = None
+
+    def process(self,chunk):
+        import scipy.fft
+        real, complex_ = float_dtypes(chunk,self.dtype)
+        chunk = np.asarray(chunk,dtype=real)
+        data = chunk if self.buffer is None else np.concatenate((self.buffer,chunk),axis=-1)
+        window_count = max(0,(data.shape[-1]-self.window_length)//self.window_step + 1)
+
+        # keep the samples from the first incomplete frame onwards
+        self.buffer = data[...,window_count*self.window_step:].copy()
+        if window_count == 0:
+            return np.zeros(data.shape[:-1] + (0,self.window_length//2+1),dtype=complex_)
+
+        frames = frame_signal(data,self.window_length,self.window_step)
+        window = np.asarray(self.windowing_function,dtype=real)
+        return scipy.fft.rfft(frames*window,n=self.window_length,axis=-1,workers=self.workers)
+
+    def reset(self):
+        self.buffer = None
+
+
+class StreamingISTFT:
+    """
+    Chunked counterpart of frame_istft(). Spectrogram frames of shape (...,
+    frames, window_length//2+1) are fed to process(), which returns the output
+    samples that no later frame can change, window_step samples per frame.
+    flush() returns the remaining window_length-window_step samples at the end
+    of the stream. The concatenated output equals frame_istft() of the
+    concatenated input, with window lengths rounded as in StreamingSTFT.
+    """
+
+    def __init__(self,fs,window_length_ms=30,window_step_ms=20,windowing_function=None,normalize=True,even_length=False,workers=None,dtype=None):
+        self.window_length, self.window_step = window_lengths(fs,window_length_ms,window_step_ms,even_length)
+        assert self.window_step <= self.window_length, "Window step must not exceed window length"
+        if windowing_function is None:
+            windowing_function = hann_window(self.window_length)
+        self.windowing_function = np.ascontiguousarray(windowing_function,dtype=float)
+        self.normalize = normalize
+        self.workers = workers
+        self.dtype = dtype
+        self.block_count = -(-self.window_length//self.window_step)
+        self.reset()
+
+    def reset(self):
+        # windowed frames that still overlap samples not yet returned
+        self.history = None
+        self.window_count = 0
+
+    def _overlap_add(self,frames,output_blocks,window_count):
+        # blocks 0 ... block_count-2 of the overlap-add only see history frames
+        data = overlap_add(frames,self.window_step)[...,(self.block_count-1)*self.window_step:]
+        data = data[...,:output_blocks*self.window_step]
+        if self.normalize:
+            j = self.window_count + np.arange(output_blocks)
+            norm = window_sum_blocks(self.windowing_function,self.window_step,window_count,j).reshape(-1)
+            normalize_window_sum(data,norm,window_sum_floor(self.windowing_function,self.window_step))
+        return data
+
+    def process(self,spectrogram):
+        import scipy.fft
+        real, complex_ = float_dtypes(spectrogram,self.dtype)
+        spectrogram = np.asarray(spectrogram,dtype=complex_)
+        frame_count = spectrogram.shape[-2]
+        frames = scipy.fft.irfft(spectrogram,n=self.window_length,axis=-1,workers=self.workers)
+        frames *= self.windowing_function.astype(real,copy=False)
+        if self.history is None:
+            self.history = np.zeros(frames.shape[:-2] + (self.block_count-1,self.window_length),dtype=real)
+        frames = np.concatenate((self.history,frames),axis=-2)
+
+        # until flush() the stream length is unknown, but a normalization block of a
+        # sample that no later frame reaches does not depend on it
+        data = self._overlap_add(frames,frame_count,self.window_count+frame_count)
+        self.history = frames[...,frames.shape[-2]-(self.block_count-1):,:]
+        self.window_count += frame_count
+        return data
+
+    def flush(self):
+        if self.window_count == 0:
+            shape = () if self.history is None else self.history.shape[:-2]
+            dtype = float if self.history is None else self.history.dtype
+            self.reset()
+            return np.zeros(shape + (0,),dtype=dtype)
+        frames = np.concatenate((self.history,np.zeros_like(self.history)),axis=-2)
+        data = self._overlap_add(frames,self.block_count-1,self.window_count)
+        data = data[...,:self.window_length-self.window_step]
+        self.reset()
+        return data
+
+
+FEATURES = ('magnitude','power','logmel','zcr','energy')
+
+def frame_features(data,fs,features=FEATURES,window_length_ms=30,window_step_ms=20,
+                   windowing_function=None,melbands=20,even_length=False,workers=None,dtype=None):
+    """
+    Compute several frame-wise features from one framing pass over 'data'.
+
+    The frames are a single strided view of the signal, and all spectral
+    features ('magnitude', 'power', 'logmel') share one batched FFT of the
+    windowed frames. 'zcr' and 'energy' are taken from the unwindowed signal.
+    The spectral features are float32 for float32 data, or as set by 'dtype'.
+    Returns a dict mapping each requested feature to an array of shape
+    (..., window_count) or (..., window_count, bins).
+    """
+    unknown = set(features) - set(FEATURES)
+    assert not unknown, "Unknown features {}".format(sorted(unknown))
+
+    window_length, window_step = window_lengths(fs,window_length_ms,window_step_ms,even_length)
+    if windowing_function is None:
+        windowing_function = hann_window(window_length)
+    real, _ = float_dtypes(data,dtype)
+    frames = frame_signal(np.asarray(data,dtype=real),window_length,window_step)
+
+    result = {}
+    if {'magnitude','power','logmel'} & set(features):
+        import scipy.fft
+        spectrum = scipy.fft.rfft(frames*np.asarray(windowing_function,dtype=real),n=window_length,axis=-1,workers=workers)
+        power = spectrum.real**2 + spectrum.imag**2
+        if 'magnitude' in features:
+            result['magnitude'] = np.abs(spectrum)
+        if 'power' in features:
+            result['power'] = power
+        if 'logmel' in features:
+            filters = melfilters(power.shape[-1],fs/2,melbands=melbands)
+            result['logmel'] = np.log(filters.apply(power) + 1e-12)
+    if 'zcr' in features:
+        result['zcr'] = frame_zcr(data,window_length,window_step)
+    if 'energy' in features:
+        result['energy'] = frame_energy(data,window_length,window_step)
+
+    return result
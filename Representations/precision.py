@@ -0,0 +1,12 @@
+# Working precision shared by the framing engine, the filterbanks and the
+# Enhancement chapter tools, so float32 input stays float32 (complex64 spectra).
+import numpy as np
+
+
+def float_dtypes(data, dtype=None):
+    # (real, complex) dtypes of a computation on 'data': single precision when 'dtype', or else
+    # the dtype of 'data', is float16, float32 or complex64, double precision otherwise
+    dtype = np.asarray(data).dtype if dtype is None else np.dtype(dtype)
+    if dtype in (np.float16, np.float32, np.complex64):
+        return np.dtype(np.float32), np.dtype(np.complex64)
+    return np.dtype(np.float64), np.dtype(np.complex128)
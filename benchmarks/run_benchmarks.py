@@ -0,0 +1,380 @@
+"""
+Benchmarks of the signal-processing and enhancement hot paths, run offline on
+the CPU:
+
+    python benchmarks/run_benchmarks.py [--quick] [--filter PATTERN]
+
+Each case times one function on inputs built from the bundled
+Enhancement/sounds and Evaluation/sounds WAVs, resampled to the case's
+sampling rate and tiled to its length, over grids of signal length, channel
+count, angle-grid size and sampling rate. The median time per call of every
+case is appended, with the git commit, library versions and machine, as one
+JSON line to benchmarks/history.jsonl, and compared to the latest earlier run
+of the same cases on the same machine. Cases whose fastest round is slower than
+in that run by more than --threshold are listed and make the script exit with
+status 1; the fastest round is the least disturbed by other load.
+
+The import.* cases time a fresh interpreter importing each helper module, as a
+short-lived worker does, with -X importtime. An import that exceeds its budget
+in IMPORT_BUDGETS, or that loads one of the heavy modules it must defer, also
+fails the run.
+"""
+import argparse
+import contextlib
+import datetime
+import fnmatch
+import glob
+import importlib.util
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import numpy as np
+import scipy
+import scipy.signal
+from scipy.io import wavfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY = os.path.join(ROOT, 'benchmarks', 'history.jsonl')
+SOUNDS = [os.path.join(ROOT, 'Enhancement', 'sounds'), os.path.join(ROOT, 'Evaluation', 'sounds')]
+
+sys.path.append(os.path.join(ROOT, 'Representations'))
+sys.path.append(os.path.join(ROOT, 'Enhancement'))
+
+# parameter grids of the full run; --quick uses the first value of each
+SECONDS = (1., 10., 60.)
+SAMPLERATES = (8000, 16000, 48000)
+CHANNELS = (5, 15)
+ANGLES = (37, 181, 721)
+ARRAY_SECONDS = (0.5, 2.)
+ENHANCER_SECONDS = (1., 10.)
+MODELS = ('SimpleEnhancer', 'NoiseModelEnhancer', 'VADNoiseModelEnhancer')
+
+# (chapter directory, module, import-time budget in seconds, modules the import must not load);
+# the budgets leave room for slower machines over about 0.15 s for numpy and 2 s for torch
+IMPORT_BUDGETS = {
+    'Representations.helper_functions': ('Representations', 'helper_functions', 0.5, ('matplotlib', 'scipy')),
+    'Enhancement.helper_functions': ('Enhancement', 'helper_functions', 0.5, ('matplotlib', 'scipy')),
+    'Enhancement.DSB_Tools': ('Enhancement', 'DSB_Tools', 0.5, ('matplotlib', 'scipy')),
+    'Enhancement.Enhancer': ('Enhancement', 'Enhancer', 5., ('torchaudio', 'scipy', 'matplotlib')),
+}
+
+
+def load_module(name, path):
+    # both chapters have a helper_functions.py, so they are loaded under distinct names
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def read_sounds():
+    # (samplerate, mono float64 samples in [-1, 1)) of all bundled WAV files
+    sounds = []
+    for filename in sorted(itertools.chain.from_iterable(glob.glob(os.path.join(d, '*.wav')) for d in SOUNDS)):
+        fs, data = wavfile.read(filename)
+        if np.issubdtype(data.dtype, np.integer):
+            data = data/-np.iinfo(data.dtype).min
+        data = data.astype(np.float64)
+        if data.ndim > 1:
+            data = np.mean(data, axis=1)
+        sounds.append((fs, data))
+    return sounds
+
+
+class Signals:
+    # speech of any length and sampling rate, built once from the bundled sounds
+
+    def __init__(self):
+        self.sounds = read_sounds()
+        self.speech = {}
+
+    def __call__(self, seconds, fs):
+        if fs not in self.speech:
+            self.speech[fs] = np.concatenate([
+                scipy.signal.resample_poly(data, fs, orig_fs) if orig_fs != fs else data
+                for orig_fs, data in self.sounds])
+        speech = self.speech[fs]
+        return np.resize(speech, int(seconds*fs))
+
+
+def timed(run, repeats, min_seconds=0.2):
+    # median and minimum seconds per call over 'repeats' rounds of 'number' calls, with
+    # 'number' chosen so that one round takes at least 'min_seconds'
+    run()
+    start = time.perf_counter()
+    run()
+    once = time.perf_counter() - start
+    number = max(1, int(min_seconds/max(once, 1e-9)))
+    rounds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        rounds.append((time.perf_counter() - start)/number)
+    return {'median': statistics.median(rounds), 'min': min(rounds), 'number': number, 'repeats': repeats}
+
+
+def import_time(directory, module, deferred):
+    # cumulative import time of 'module' in a fresh interpreter, in seconds, and the
+    # 'deferred' modules (or their submodules) that the import loaded
+    code = ('import json, sys; sys.path.insert(0, {!r}); import {}; '
+            'print(json.dumps(sorted({{name.split(".")[0] for name in sys.modules}} & set({!r}))))'
+            ).format(os.path.join(ROOT, directory), module, list(deferred))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                             capture_output=True, text=True, check=True)
+    # lines of the form 'import time: self [us] | cumulative | <indent>name'; the top level one
+    # of the module has the largest cumulative time
+    cumulative = max(int(line.split('|')[1]) for line in process.stderr.splitlines()
+                     if line.startswith('import time:') and line.split('|')[2].strip() == module)
+    return cumulative/1e6, json.loads(process.stdout)
+
+
+def timed_imports(repeats, pattern=None):
+    # import.* results with the import-time budget and the deferred modules loaded
+    results = {}
+    for name, (directory, module, budget, deferred) in IMPORT_BUDGETS.items():
+        key = 'import.' + name
+        if pattern and not fnmatch.fnmatch(key, pattern):
+            continue
+        rounds, loaded = [], set()
+        for _ in range(repeats):
+            seconds, modules = import_time(directory, module, deferred)
+            rounds.append(seconds)
+            loaded.update(modules)
+        results[key] = {'median': statistics.median(rounds), 'min': min(rounds), 'number': 1,
+                        'repeats': repeats, 'budget': budget, 'loaded': sorted(loaded)}
+    return results
+
+
+def grid(values, quick):
+    return values[:1] if quick else values
+
+
+def cases(quick):
+    """
+    Yield (name, parameters, audio seconds, setup), where setup() builds the inputs
+    and returns the function to time.
+    """
+    signals = Signals()
+    representations = load_module('representations_helper_functions',
+                                  os.path.join(ROOT, 'Representations', 'helper_functions.py'))
+    enhancement = load_module('enhancement_helper_functions',
+                              os.path.join(ROOT, 'Enhancement', 'helper_functions.py'))
+    import filterbanks
+    import DSB_Tools as dsb
+
+    for (chapter, module), seconds, fs in itertools.product(
+            (('representations', representations), ('enhancement', enhancement)),
+            grid(SECONDS, quick), grid(SAMPLERATES, quick)):
+        params = {'seconds': seconds, 'fs': fs}
+
+        def setup_stft(module=module, seconds=seconds, fs=fs):
+            data = signals(seconds, fs)
+            return lambda: module.stft(data, fs)
+
+        def setup_istft(module=module, seconds=seconds, fs=fs):
+            spectrogram = enhancement.stft(signals(seconds, fs), fs)
+            return lambda: module.istft(spectrogram, fs)
+
+        def setup_zcr(module=module, seconds=seconds, fs=fs):
+            data = signals(seconds, fs)
+            return lambda: module.zcr(data, fs)
+
+        yield chapter + '.stft', params, seconds, setup_stft
+        yield chapter + '.istft', params, seconds, setup_istft
+        yield chapter + '.zcr', params, seconds, setup_zcr
+
+    for seconds, fs in itertools.product(grid(SECONDS, quick), grid(SAMPLERATES, quick)):
+        params = {'seconds': seconds, 'fs': fs}
+
+        # building the filters, with the cache cleared, and applying them to a spectrogram
+        def setup_melfilterbank(seconds=seconds, fs=fs):
+            power = np.abs(representations.stft(signals(seconds, fs), fs))**2
+            def run():
+                filterbanks._melfilters.cache_clear()
+                filterbank, reconstruct = filterbanks.melfilterbank(power.shape[1], fs/2, melbands=40)
+                return (power @ filterbank) @ reconstruct
+            return run
+
+        def setup_linearfilterbank(seconds=seconds, fs=fs):
+            power = np.abs(representations.stft(signals(seconds, fs), fs))**2
+            def run():
+                filterbanks._linearfilters.cache_clear()
+                filterbank, reconstruct = filterbanks.linearfilterbank(power.shape[1], fs/2)
+                return (power @ filterbank) @ reconstruct
+            return run
+
+        yield 'filterbanks.melfilterbank', params, seconds, setup_melfilterbank
+        yield 'filterbanks.linearfilterbank', params, seconds, setup_linearfilterbank
+
+    # a fresh array for every call, so steering phases are computed rather than taken from its cache
+    def sensor_array(channels):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return dsb.SensorArray(1.4, channels)
+
+    for seconds, fs, channels in itertools.product(
+            grid(ARRAY_SECONDS, quick), grid(SAMPLERATES, quick), grid(CHANNELS, quick)):
+        params = {'seconds': seconds, 'fs': fs, 'channels': channels}
+
+        def setup_delay_signal(seconds=seconds, fs=fs, channels=channels):
+            x = np.tile(signals(seconds, fs), (channels, 1))
+            t0 = np.linspace(0, 1e-3, channels)
+            return lambda: dsb.delay_signal(x, t0, fs)
+
+        def setup_create_array_signals(seconds=seconds, fs=fs, channels=channels):
+            source = signals(seconds/2, fs)
+            return lambda: dsb.create_array_signals(sensor_array(channels), source, seconds/4, seconds, 60., fs, SNR_dB=20)
+
+        yield 'DSB_Tools.delay_signal', params, seconds, setup_delay_signal
+        yield 'DSB_Tools.create_array_signals', params, seconds, setup_create_array_signals
+
+        for angles in grid(ANGLES, quick):
+            def setup_delayandsum(seconds=seconds, fs=fs, channels=channels, angles=angles):
+                p_array = dsb.create_array_signals(
+                    sensor_array(channels), signals(seconds/2, fs), seconds/4, seconds, 60., fs, SNR_dB=20)
+                theta = np.linspace(0, np.pi, angles)
+                weights = np.ones(channels)
+                return lambda: dsb.delayandsum_beamformer(sensor_array(channels), p_array, theta, weights, fs)
+
+            yield 'DSB_Tools.delayandsum_beamformer', dict(params, angles=angles), seconds, setup_delayandsum
+
+    for model, seconds, fs in itertools.product(MODELS, grid(ENHANCER_SECONDS, quick), grid(SAMPLERATES, quick)):
+        def setup_enhancer(model=model, seconds=seconds, fs=fs):
+            import torch
+            import Enhancer
+            # the bundled checkpoints do not match the model definitions, so fixed-seed weights are timed
+            torch.manual_seed(0)
+            enhancer = getattr(Enhancer, model)(input_samplerate=fs).eval()
+            waveform = torch.from_numpy(signals(seconds, fs).astype(np.float32))
+            def run():
+                with torch.inference_mode():
+                    return enhancer(waveform)
+            return run
+
+        yield 'Enhancer.' + model, {'seconds': seconds, 'fs': fs}, seconds, setup_enhancer
+
+
+def case_id(name, params):
+    return name + '[' + ','.join('{}={:g}'.format(key, value) for key, value in params.items()) + ']'
+
+
+def over_budget(results):
+    # import.* cases slower than their budget or loading modules they should defer
+    return [(key, result) for key, result in results.items()
+            if 'budget' in result and (result['min'] > result['budget'] or result['loaded'])]
+
+
+def versions():
+    import torch
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+            'torch': torch.__version__, 'threads': torch.get_num_threads()}
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True)
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                cwd=ROOT, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.stdout.strip(), bool(status.stdout.strip())
+
+
+def machine():
+    return {'system': platform.system(), 'machine': platform.machine(),
+            'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_run(history, run):
+    # the latest run on the same machine that has any of the cases of this run
+    for entry in reversed(history):
+        if entry['machine'] == run['machine'] and set(entry['results']) & set(run['results']):
+            return entry
+    return None
+
+
+def regressions(previous, run, threshold, floor=1e-4):
+    # cases whose fastest round grew by more than 'threshold', relative, and 'floor' seconds
+    slower = []
+    for key, result in run['results'].items():
+        if key not in previous['results']:
+            continue
+        before, after = previous['results'][key]['min'], result['min']
+        if after > before*(1+threshold) and after - before > floor:
+            slower.append((key, before, after))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the signal-processing and enhancement hot paths.')
+    parser.add_argument('--quick', action='store_true', help='only the smallest value of each parameter')
+    parser.add_argument('--filter', help='only cases whose name matches this glob pattern, e.g. "DSB_Tools.*"')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=1, help='torch intra-op threads')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative slowdown reported as a regression')
+    parser.add_argument('--history', default=HISTORY, help='JSON lines file of earlier runs')
+    parser.add_argument('--no-record', action='store_true', help='compare to the history without appending this run')
+    args = parser.parse_args(argv)
+
+    import torch
+    torch.set_num_threads(args.threads)
+
+    results = timed_imports(args.repeats, args.filter)
+    for key, result in results.items():
+        print('{:<80}{:>12.3f} ms  {}'.format(key, result['min']*1000, 'loads ' + ', '.join(result['loaded'])
+                                              if result['loaded'] else ''), flush=True)
+    for name, params, seconds, setup in cases(args.quick):
+        if args.filter and not fnmatch.fnmatch(name, args.filter):
+            continue
+        key = case_id(name, params)
+        result = timed(setup(), args.repeats)
+        result['rtf'] = result['median']/seconds
+        results[key] = result
+        print('{:<80}{:>12.3f} ms{:>10.4f} RTF'.format(key, result['median']*1000, result['rtf']), flush=True)
+
+    commit, dirty = git_commit()
+    run = {'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+           'commit': commit, 'dirty': dirty, 'quick': args.quick,
+           'machine': machine(), 'versions': versions(), 'results': results}
+
+    history = read_history(args.history)
+    previous = previous_run(history, run)
+    slower = regressions(previous, run, args.threshold) if previous else []
+    if previous is None:
+        print('No earlier run on this machine in {}'.format(args.history))
+    else:
+        print('Compared to {} ({}): {} of {} cases slower by more than {:.0%}'.format(
+            (previous['commit'] or 'unknown commit')[:10], previous['timestamp'],
+            len(slower), len(set(results) & set(previous['results'])), args.threshold))
+        for key, before, after in slower:
+            print('  {:<80}{:>10.3f} ms -> {:>10.3f} ms ({:+.0%})'.format(
+                key, before*1000, after*1000, after/before - 1))
+
+    failed_imports = over_budget(results)
+    for key, result in failed_imports:
+        print('{} fails its import budget: {:.3f} s of {:.3f} s{}'.format(
+            key, result['min'], result['budget'],
+            ', loads ' + ', '.join(result['loaded']) if result['loaded'] else ''))
+
+    if not args.no_record:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(run) + '\n')
+    return 1 if slower or failed_imports else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())